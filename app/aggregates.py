@@ -0,0 +1,113 @@
+"""Aggregates over the collections table, maintained on every insert.
+
+Each aggregate is updated in the same transaction as the collection it
+counts, so reading it is an indexed lookup instead of a scan over a
+collector's whole history. The rebuild functions recompute the tables from
+raw collections for repair.
+
+Daily rollups are split into ROLLUP_SHARDS rows per (day, item), picked by
+collector, so collectors recording the same item on the same day do not all
+queue on one row lock. Readers sum over the shards.
+"""
+import os
+from datetime import date
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+from . import models
+
+ROLLUP_SHARDS = int(os.getenv("ROLLUP_SHARDS", "16"))
+
+
+def dialect_insert(db: Session):
+    """Return the dialect-specific insert() that supports ON CONFLICT"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert
+
+def increment(db: Session, model, key_columns: list, rows: list):
+    """Add each row's amounts to the row identified by its key columns, creating it if needed.
+
+    All rows go in one executemany, so they must not repeat a key. They are
+    sent in key order, so concurrent writers lock shared rows in the same
+    order and cannot deadlock on PostgreSQL.
+    """
+    rows = sorted(rows, key=lambda row: tuple(row[column] for column in key_columns))
+    table = model.__table__
+    stmt = dialect_insert(db)(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={column: table.c[column] + stmt.excluded[column] for column in rows[0] if column not in key_columns}
+    )
+    db.execute(stmt, rows)
+
+# --- Per-collector stats ---
+def record_category_totals(db: Session, collector_id: int, totals: dict):
+    """Add {category: (count, weight_kg, earned)} to a collector's stats in one statement"""
+    increment(db, models.CollectorCategoryStats, ["collector_id", "category"], [
+        {
+            "collector_id": collector_id,
+            "category": category,
+            "collection_count": count,
+            "total_weight_kg": weight_kg,
+            "total_earned": earned_amount
+        }
+        for category, (count, weight_kg, earned_amount) in totals.items()
+    ])
+
+def rebuild_collector_stats(db: Session) -> int:
+    """Recompute collector_category_stats from collections, returns row count"""
+    db.execute(delete(models.CollectorCategoryStats))
+    result = db.execute(
+        insert(models.CollectorCategoryStats).from_select(
+            ["collector_id", "category", "collection_count", "total_weight_kg", "total_earned"],
+            select(
+                models.Collection.collector_id,
+                models.Collection.item_category,
+                func.count(models.Collection.id),
+                func.coalesce(func.sum(models.Collection.weight_kg), 0.0),
+                func.coalesce(func.sum(models.Collection.earned_amount), 0.0)
+            ).group_by(
+                models.Collection.collector_id, models.Collection.item_category
+            )
+        )
+    )
+    return result.rowcount
+
+# --- Daily rollups for the admin dashboard ---
+def record_item_totals(db: Session, day: date, collector_id: int, totals: dict):
+    """Add a collector's {item_id: (count, weight_kg, earned)} to a day's rollups in one statement"""
+    increment(db, models.DailyItemRollup, ["day", "item_id", "shard"], [
+        {
+            "day": day,
+            "item_id": item_id,
+            "shard": collector_id % ROLLUP_SHARDS,
+            "collection_count": count,
+            "total_weight_kg": weight_kg,
+            "total_revenue": earned_amount
+        }
+        for item_id, (count, weight_kg, earned_amount) in totals.items()
+    ])
+
+def rebuild_daily_rollups(db: Session) -> int:
+    """Recompute daily_item_rollups from collections, returns row count"""
+    day = func.date(models.Collection.collected_at)
+    shard = models.Collection.collector_id % ROLLUP_SHARDS
+    db.execute(delete(models.DailyItemRollup))
+    result = db.execute(
+        insert(models.DailyItemRollup).from_select(
+            ["day", "item_id", "shard", "collection_count", "total_weight_kg", "total_revenue"],
+            select(
+                day,
+                models.Collection.item_id,
+                shard,
+                func.count(models.Collection.id),
+                func.coalesce(func.sum(models.Collection.weight_kg), 0.0),
+                func.coalesce(func.sum(models.Collection.earned_amount), 0.0)
+            ).group_by(
+                day, models.Collection.item_id, shard
+            )
+        )
+    )
+    return result.rowcount
@@ -2,47 +2,73 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from typing import NamedTuple, Optional
 from . import models
-from .database import get_db
+from .cache import TTLCache
+from .database import get_async_db
+from .passwords import password_hasher
+from .revocation import revocations, EPOCH
+import hashlib
 import os
-import bcrypt
+import secrets
+import uuid
 
 # Password hashing
-# Removed passlib due to compatibility issues with newer bcrypt/Python versions
+# Removed passlib due to compatibility issues with newer bcrypt/Python versions.
+# bcrypt runs on the bounded process pool in passwords.py.
 
 # JWT settings
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
+# Access tokens are short-lived and checked without the database; refresh
+# tokens are stored (hashed), single-use, and exchanged at /collectors/refresh.
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
 
 # Security
 security = HTTPBearer()
 
+# Resolved principals by token subject. Admin user changes invalidate entries
+# explicitly; the TTL bounds staleness across worker processes.
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+
+class Principal(NamedTuple):
+    id: int
+    username: str
+    role: str
+    is_active: bool
+    jti: Optional[str] = None  # Token id and expiry, unset for legacy tokens
+    expires_at: Optional[int] = None
+
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+
+def invalidate_principal(username: str):
+    """Drop a cached principal after its role, status or username changed"""
+    principal_cache.pop(username)
+
 def verify_password(plain_password, hashed_password):
     """Verify password against hash"""
-    try:
-        return bcrypt.checkpw(
-            plain_password.encode('utf-8'),
-            hashed_password.encode('utf-8')
-        )
-    except Exception:
-        return False
+    return password_hasher.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     """Hash a password"""
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-    return hashed.decode('utf-8')
+    return password_hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """Create JWT access token"""
     to_encode = data.copy()
+    now = datetime.utcnow()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        expire = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": now, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -54,11 +80,85 @@ def decode_token(token: str):
     except JWTError:
         return None
 
-def get_current_collector(
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def issue_tokens(db: Session, collector: models.Collector) -> dict:
+    """Create an access token and a refresh token; the caller commits"""
+    refresh_token = secrets.token_urlsafe(32)
+    db.add(models.RefreshToken(
+        token_hash=hash_refresh_token(refresh_token),
+        collector_id=collector.id,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    ))
+    access_token = create_access_token(
+        data={"sub": collector.username, "uid": collector.id, "role": collector.role}
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    }
+
+def rotate_refresh_token(db: Session, refresh_token: str) -> models.Collector:
+    """Spend a refresh token and return its collector.
+
+    Presenting a token that was already spent revokes every refresh token of
+    the collector, since one of the two holders of it is not the owner.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    stored = db.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == hash_refresh_token(refresh_token)
+    ).first()
+    if stored is None or stored.expires_at <= datetime.utcnow():
+        raise credentials_exception
+    
+    # Spend the token atomically so two concurrent refreshes cannot both win
+    spent = db.query(models.RefreshToken).filter(
+        models.RefreshToken.id == stored.id,
+        models.RefreshToken.revoked_at.is_(None)
+    ).update({"revoked_at": datetime.utcnow()}, synchronize_session=False)
+    if not spent:
+        revoke_refresh_tokens(db, stored.collector_id)
+        db.commit()
+        raise credentials_exception
+    
+    collector = db.get(models.Collector, stored.collector_id)
+    if collector is None:
+        raise credentials_exception
+    if not collector.is_active:
+        raise HTTPException(status_code=400, detail="Inactive collector")
+    return collector
+
+def revoke_refresh_tokens(db: Session, collector_id: int):
+    db.query(models.RefreshToken).filter(
+        models.RefreshToken.collector_id == collector_id,
+        models.RefreshToken.revoked_at.is_(None)
+    ).update({"revoked_at": datetime.utcnow()}, synchronize_session=False)
+
+def revoke_collector_tokens(db: Session, collector_id: int):
+    """Log a collector out everywhere: refresh tokens now, access tokens within the sync interval"""
+    revoke_refresh_tokens(db, collector_id)
+    revocations.revoke_collector(
+        db, collector_id, datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+
+def revoke_access_token(db: Session, principal: Principal):
+    if principal.jti is not None:
+        revocations.revoke_token(
+            db, principal.jti, EPOCH + timedelta(seconds=principal.expires_at)
+        )
+
+async def get_current_principal(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-):
-    """Get current authenticated collector"""
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """Get the authenticated principal from the token claims, or the cache for legacy tokens"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -75,20 +175,58 @@ def get_current_collector(
     if username is None:
         raise credentials_exception
     
-    collector = db.query(models.Collector).filter(models.Collector.username == username).first()
-    if collector is None:
-        raise credentials_exception
+    if "uid" in payload:
+        if revocations.is_revoked(payload.get("jti"), payload["uid"], payload.get("iat", 0)):
+            raise credentials_exception
+        return Principal(
+            payload["uid"], username, payload.get("role"), True, payload.get("jti"), payload.get("exp")
+        )
     
-    if not collector.is_active:
+    # Tokens issued before refresh tokens existed carry only the username
+    principal = principal_cache.get(username)
+    if principal is None:
+        row = (await db.execute(select(
+            models.Collector.id,
+            models.Collector.username,
+            models.Collector.role,
+            models.Collector.is_active
+        ).where(models.Collector.username == username))).first()
+        if row is None:
+            raise credentials_exception
+        principal = Principal(*row)
+        principal_cache.set(username, principal)
+    
+    if not principal.is_active:
         raise HTTPException(status_code=400, detail="Inactive collector")
     
+    return principal
+
+async def get_current_collector(
+    principal: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get current authenticated collector as an ORM object, for routes that change it"""
+    collector = await db.get(models.Collector, principal.id)
+    if collector is None:
+        invalidate_principal(principal.username)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if not collector.is_active:
+        raise HTTPException(status_code=400, detail="Inactive collector")
     return collector
 
-def authenticate_collector(db: Session, username: str, password: str):
+async def authenticate_collector(db: AsyncSession, username: str, password: str):
     """Authenticate collector by username and password"""
-    collector = db.query(models.Collector).filter(models.Collector.username == username).first()
+    collector = await db.scalar(select(models.Collector).where(models.Collector.username == username))
     if not collector:
         return None
-    if not verify_password(password, collector.hashed_password):
+    # bcrypt runs on the worker processes; only a threadpool thread waits for it
+    if not await run_in_threadpool(verify_password, password, collector.hashed_password):
         return None
+    if not collector.is_active:
+        # Access tokens are not checked against the database, so bans are enforced here
+        raise HTTPException(status_code=400, detail="Inactive collector")
     return collector
\ No newline at end of file
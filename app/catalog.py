@@ -0,0 +1,137 @@
+"""In-memory cache of the recyclable item catalog.
+
+The catalog is small and only changes through the admin item endpoints, so the
+citizen read paths are served from a snapshot held in process memory. Every
+admin write bumps a version row in the same transaction; each worker compares
+its snapshot against that row at most once per CATALOG_VERSION_CHECK_SECONDS,
+so writes made by other workers are picked up without a query per request.
+
+Each snapshot also carries a strong ETag made from its version and a digest of
+its encoded items. The citizen routes answer a matching If-None-Match with 304
+straight from the snapshot, and send a Cache-Control header that lets shared
+proxies keep the catalog for CATALOG_CACHE_MAX_AGE_SECONDS.
+"""
+import hashlib
+import os
+import threading
+import time
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from . import models, schemas
+from .aggregates import dialect_insert
+from .database import SessionLocal
+from .search import SearchIndex
+
+CATALOG_VERSION_CHECK_SECONDS = float(os.getenv("CATALOG_VERSION_CHECK_SECONDS", "5"))
+CATALOG_CACHE_MAX_AGE_SECONDS = int(os.getenv("CATALOG_CACHE_MAX_AGE_SECONDS", "60"))
+CATALOG_CACHE_CONTROL = f"public, max-age={CATALOG_CACHE_MAX_AGE_SECONDS}"
+
+
+class CatalogSnapshot:
+    """Immutable view of the catalog, indexed by id, name, category and search terms"""
+
+    def __init__(self, version: int, items: list):
+        self.version = version
+        self.items = items  # Ordered by id, like the previous table scans
+        self.by_id = {item.id: item for item in items}
+        self.encoded = {item.id: item.model_dump_json().encode("utf-8") for item in items}  # Sent as-is
+        digest = hashlib.sha256(b"\n".join(self.encoded.values())).hexdigest()[:16]
+        self.etag = f'"{version}-{digest}"'
+        self.by_name = {item.name.lower(): item for item in items}
+        self.by_category = {}
+        for item in items:
+            self.by_category.setdefault(item.category, []).append(item)
+        self.search_index = SearchIndex(items)
+
+    @property
+    def categories(self):
+        return list(self.by_category)
+
+
+class CatalogCache:
+    def __init__(self, session_factory=SessionLocal, check_interval: float = CATALOG_VERSION_CHECK_SECONDS):
+        self.session_factory = session_factory
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+        self.hits = 0  # Reads served without a query
+        self.misses = 0  # Reads that checked the version or reloaded
+
+    def _fresh(self):
+        """The snapshot if it was checked within check_interval, else None"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+        return None
+
+    def snapshot(self) -> CatalogSnapshot:
+        """Return the current snapshot, reloading it if the stored version moved"""
+        snapshot = self._fresh()
+        if snapshot is not None:
+            self.hits += 1
+            return snapshot
+
+        with self._lock:
+            snapshot = self._fresh()
+            if snapshot is not None:
+                self.hits += 1
+                return snapshot
+            snapshot = self._snapshot
+            self.misses += 1
+            db = self.session_factory()
+            try:
+                version = get_version(db)
+                if snapshot is None or snapshot.version != version:
+                    items = db.query(models.RecyclableItem).order_by(models.RecyclableItem.id).all()
+                    snapshot = CatalogSnapshot(
+                        version,
+                        [schemas.RecyclableItemResponse.model_validate(item) for item in items]
+                    )
+            finally:
+                db.close()
+
+            self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+            return snapshot
+
+    async def snapshot_async(self) -> CatalogSnapshot:
+        """snapshot() for async routes: the version check and reload run on the threadpool"""
+        snapshot = self._fresh()
+        if snapshot is not None:
+            self.hits += 1
+            return snapshot
+        # The check queries the database and may wait on the lock or the pool,
+        # which must not block the event loop
+        return await run_in_threadpool(self.snapshot)
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {"size": len(snapshot.items) if snapshot else 0, "hits": self.hits, "misses": self.misses}
+
+    def invalidate(self):
+        """Drop the local snapshot so the next read reloads it"""
+        with self._lock:
+            self._snapshot = None
+            self._checked_at = 0.0
+
+
+def get_version(db: Session) -> int:
+    """Read the shared catalog version (0 until the first admin write)"""
+    version = db.execute(
+        select(models.CatalogVersion.version).where(models.CatalogVersion.id == 1)
+    ).scalar()
+    return version or 0
+
+def bump_version(db: Session):
+    """Increment the shared catalog version inside the caller's transaction"""
+    # One upsert, so concurrent first writers cannot both try to insert the row
+    stmt = dialect_insert(db)(models.CatalogVersion).values(id=1, version=1)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["id"],
+        set_={"version": models.CatalogVersion.version + 1}
+    ))
+
+
+catalog = CatalogCache()
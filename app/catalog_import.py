@@ -0,0 +1,117 @@
+"""Bulk catalog loader shared by the admin import endpoint, the CLI and the seed.
+
+A catalog file is a list of items keyed by name, in CSV (header row with
+name, category, instructions, price_per_kg) or JSON (a list of objects).
+Rows for new names create items. Rows for existing names update only the
+fields they carry, so a file of name and price_per_kg is a mass price change.
+The whole file is validated before anything is written. All changes are then
+applied in one transaction with executemany, and the catalog version is
+bumped and the cache invalidated once.
+"""
+import csv
+import io
+import json
+from typing import Optional
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from . import models
+from .catalog import catalog, bump_version
+
+IMPORT_FIELDS = ("name", "category", "instructions", "price_per_kg")
+
+
+class CatalogImportRow(BaseModel):
+    name: str = Field(..., min_length=1)
+    category: Optional[str] = Field(None, min_length=1)
+    instructions: Optional[str] = None
+    price_per_kg: Optional[float] = Field(None, ge=0)
+
+
+class CatalogImportError(ValueError):
+    def __init__(self, errors: list):
+        super().__init__(f"{len(errors)} invalid catalog rows")
+        self.errors = errors
+
+
+def parse_catalog(content, fmt: str) -> list:
+    """Parse CSV or JSON catalog content into raw row dicts"""
+    if isinstance(content, bytes):
+        try:
+            content = content.decode("utf-8-sig")
+        except UnicodeDecodeError as exc:
+            raise CatalogImportError([{"row": None, "detail": f"File is not valid UTF-8: {exc}"}])
+    if fmt == "csv":
+        return [
+            {key: value for key, value in row.items() if key in IMPORT_FIELDS and value not in (None, "")}
+            for row in csv.DictReader(io.StringIO(content))
+        ]
+    if fmt == "json":
+        try:
+            rows = json.loads(content)
+        except ValueError as exc:
+            raise CatalogImportError([{"row": None, "detail": f"Invalid JSON: {exc}"}])
+        if not isinstance(rows, list):
+            raise CatalogImportError([{"row": None, "detail": "Expected a JSON list of items"}])
+        return rows
+    raise CatalogImportError([{"row": None, "detail": f"Unsupported format '{fmt}'"}])
+
+def import_catalog(db: Session, rows: list) -> dict:
+    """Validate every row, then upsert them all in one transaction.
+
+    Raises CatalogImportError listing every invalid row, before any write.
+    """
+    items, errors, seen = [], [], set()
+    for number, raw in enumerate(rows, start=1):
+        try:
+            item = CatalogImportRow.model_validate(raw)
+        except ValidationError as exc:
+            errors.extend(
+                {"row": number, "detail": f"{'.'.join(map(str, error['loc']))}: {error['msg']}"}
+                for error in exc.errors()
+            )
+            continue
+        if item.name in seen:
+            errors.append({"row": number, "detail": f"Duplicate item '{item.name}'"})
+            continue
+        seen.add(item.name)
+        items.append((number, item))
+
+    existing = {
+        item.name: item
+        for item in db.query(models.RecyclableItem).filter(models.RecyclableItem.name.in_(seen))
+    } if seen else {}
+
+    new_rows, updates, unchanged = [], [], 0
+    for number, item in items:
+        fields = item.model_dump(exclude_unset=True, exclude_none=True, exclude={"name"})
+        current = existing.get(item.name)
+        if current is None:
+            if item.category is None:
+                errors.append({"row": number, "detail": f"New item '{item.name}' needs a category"})
+                continue
+            new_rows.append({
+                "name": item.name,
+                "category": item.category,
+                "instructions": item.instructions,
+                "price_per_kg": item.price_per_kg or 0.0
+            })
+        else:
+            changed = {key: value for key, value in fields.items() if getattr(current, key) != value}
+            if changed:
+                updates.append({"id": current.id, **changed})
+            else:
+                unchanged += 1
+    if errors:
+        raise CatalogImportError(sorted(errors, key=lambda error: error["row"]))
+
+    if new_rows:
+        db.execute(insert(models.RecyclableItem), new_rows)
+    if updates:
+        db.execute(update(models.RecyclableItem), updates)
+    if new_rows or updates:
+        bump_version(db)
+    db.commit()
+    if new_rows or updates:
+        catalog.invalidate()
+    return {"created": len(new_rows), "updated": len(updates), "unchanged": unchanged}
@@ -0,0 +1,255 @@
+"""Response compression and precompressed static files.
+
+CompressionMiddleware negotiates Brotli (when the brotli package is installed)
+or gzip from Accept-Encoding for responses of at least COMPRESSION_MINIMUM_SIZE
+bytes. Media that is already compressed (images, archives) is sent as-is. When
+a response is compressed on the fly, a strong ETag becomes weak: the bytes on
+the wire differ from the identity representation the ETag was made for. The
+middleware is written against the plain ASGI interface, so it does not
+depend on Starlette's GZipMiddleware internals.
+
+PrecompressedStaticFiles serves the .br / .gz files written next to text
+assets by `python -m app.manage compress-static` to clients that accept them,
+so static pages cost no compression work per request. Uploaded images are
+stored under a fresh UUID name and never rewritten, so they are sent with a
+year-long immutable Cache-Control.
+"""
+import gzip
+import mimetypes
+import os
+import re
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "500"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# Media types that are already compressed (or streamed as events) and sent as-is
+EXCLUDED_CONTENT_TYPES = (
+    "audio/", "video/", "image/avif", "image/gif", "image/jpeg", "image/png", "image/webp",
+    "font/woff", "application/gzip", "application/x-gzip", "application/zip", "application/grpc",
+    "text/event-stream",
+)
+
+# Extensions worth precompressing; everything else is already compressed media
+COMPRESSIBLE_EXTENSIONS = {".html", ".css", ".js", ".mjs", ".json", ".map", ".svg", ".txt", ".xml"}
+PRECOMPRESSED_SUFFIXES = (("br", ".br"), ("gzip", ".gz"))
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+UUID_IMAGE = re.compile(
+    r"images/[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.\w+"
+)
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """Codings the client accepts, leaving out any it disabled with q=0"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        params = params.strip()
+        try:
+            quality = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            continue
+        if coding.strip() and quality > 0:
+            accepted.add(coding.strip())
+    return accepted
+
+
+class _GzipStream:
+    def __init__(self, level: int):
+        self._zlib = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class _BrotliStream:
+    def __init__(self, quality: int):
+        self._brotli = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self._brotli.process(data) + (self._brotli.finish() if final else self._brotli.flush())
+
+
+class _CompressionResponder:
+    """Compresses one response, once its headers and first body chunk show it is worth it.
+
+    encoding is None when the client accepts no supported coding; the response
+    then still gets Vary: Accept-Encoding, so shared caches keep variants apart.
+    """
+
+    def __init__(self, app, minimum_size: int, encoding: str = None, new_stream=None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoding = encoding
+        self.new_stream = new_stream
+        self.send = None
+        self.start = None  # Held back until the first body chunk
+        self.stream = None
+        self.passthrough = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message):
+        if message["type"] == "http.response.start":
+            if message["status"] == 304:
+                # Revalidates a representation that may have been compressed, so
+                # caches must match it on Accept-Encoding like the 200 it stands for
+                MutableHeaders(raw=message["headers"]).add_vary_header("Accept-Encoding")
+                self.passthrough = True
+                await self.send(message)
+                return
+            headers = Headers(raw=message["headers"])
+            media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+            self.passthrough = (
+                "content-encoding" in headers
+                or message["status"] == 206
+                or media_type.startswith(EXCLUDED_CONTENT_TYPES)
+            )
+            if self.passthrough:
+                await self.send(message)
+            else:
+                self.start = message
+            return
+
+        if self.passthrough or message["type"] != "http.response.body":
+            if self.start is not None:
+                start, self.start = self.start, None
+                await self.send(start)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            if len(body) < self.minimum_size and not more_body:
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            headers = MutableHeaders(raw=start["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            if self.encoding is None:
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            self.stream = self.new_stream()
+            headers["Content-Encoding"] = self.encoding
+            # The bytes on the wire no longer match the identity representation
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            body = self.stream.compress(body, final=not more_body)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(body))
+            await self.send(start)
+        else:
+            body = self.stream.compress(body, final=not more_body)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MINIMUM_SIZE,
+        gzip_level: int = COMPRESSION_GZIP_LEVEL,
+        brotli_quality: int = COMPRESSION_BROTLI_QUALITY
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            responder = _CompressionResponder(
+                self.app, self.minimum_size, "br", lambda: _BrotliStream(self.brotli_quality)
+            )
+        elif "gzip" in accepted:
+            responder = _CompressionResponder(
+                self.app, self.minimum_size, "gzip", lambda: _GzipStream(self.gzip_level)
+            )
+        else:
+            responder = _CompressionResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        request_headers = Headers(scope=scope)
+        headers = {}
+        if UUID_IMAGE.fullmatch(os.path.relpath(full_path, self.directory).replace(os.sep, "/")):
+            headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+
+        response = None
+        if os.path.splitext(full_path)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+            headers["Vary"] = "Accept-Encoding"
+            accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            for encoding, suffix in PRECOMPRESSED_SUFFIXES:
+                if encoding not in accepted:
+                    continue
+                try:
+                    variant_stat = os.stat(full_path + suffix)
+                except FileNotFoundError:
+                    continue
+                # Skip variants left over from before the source file last changed
+                if variant_stat.st_mtime >= stat_result.st_mtime:
+                    response = FileResponse(
+                        full_path + suffix,
+                        status_code=status_code,
+                        headers={**headers, "Content-Encoding": encoding},
+                        media_type=mimetypes.guess_type(full_path)[0] or "text/plain",
+                        stat_result=variant_stat
+                    )
+                    break
+        if response is None:
+            response = FileResponse(full_path, status_code=status_code, headers=headers, stat_result=stat_result)
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def compress_static(directories: list) -> list:
+    """Write .gz (and .br, when brotli is installed) next to every compressible file"""
+    written = []
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                    continue
+                path = os.path.join(root, name)
+                with open(path, "rb") as source:
+                    content = source.read()
+                variants = {".gz": gzip.compress(content, compresslevel=9, mtime=0)}
+                if brotli is not None:
+                    variants[".br"] = brotli.compress(content, quality=11)
+                for suffix, compressed in variants.items():
+                    # A variant that does not save anything is not worth serving
+                    if len(compressed) >= len(content):
+                        continue
+                    with open(path + suffix, "wb") as target:
+                        target.write(compressed)
+                    written.append(path + suffix)
+    return written
@@ -1,14 +1,191 @@
-from sqlalchemy import create_engine
+import logging
+import os
+import re
+import time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from .metrics import MeteredAsyncQueuePool, MeteredQueuePool, current_request, record_query
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./waste_app.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./waste_app.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Routes are async and query through async_engine (aiosqlite or psycopg's
+# async driver), so a request waiting on the database holds no thread. The
+# sync engine serves migrations, maintenance commands and the background
+# threads (catalog reloads, search log, revocations, exports). Blocking calls
+# that remain, such as waiting for bcrypt, go to Starlette's threadpool,
+# resized to THREADPOOL_SIZE at startup (Starlette's default is 40).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "40"))  # Async engine, used by requests
+DB_SYNC_POOL_SIZE = int(os.getenv("DB_SYNC_POOL_SIZE", "10"))  # Sync engine
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Seconds, -1 disables
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))  # PostgreSQL only
+
+# SQLite profile applied to every new connection. WAL lets readers and the
+# writer proceed concurrently, and synchronous=NORMAL only fsyncs at checkpoints.
+# The page cache is per connection, so SQLITE_CACHE_BUDGET_MB is shared out
+# across both pools instead of being given to each connection.
+SQLITE_CACHE_BUDGET_MB = int(os.getenv("SQLITE_CACHE_BUDGET_MB", "128"))
+SQLITE_CACHE_SIZE_KIB = int(os.getenv(
+    "SQLITE_CACHE_SIZE_KIB",
+    str(max(2048, SQLITE_CACHE_BUDGET_MB * 1024 // (DB_POOL_SIZE + DB_SYNC_POOL_SIZE + 2 * DB_MAX_OVERFLOW)))
+))
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": -SQLITE_CACHE_SIZE_KIB,  # Negative means KiB
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+
+# Statements slower than SLOW_QUERY_MS are logged with their route and
+# parameters. A statement run N_PLUS_ONE_THRESHOLD times in one request, with
+# only its values changing, is reported as a likely N+1: logged by default,
+# raised as RepeatedQueryError with N_PLUS_ONE_MODE=raise (the test suite), or
+# ignored with N_PLUS_ONE_MODE=off.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+N_PLUS_ONE_MODE = os.getenv("N_PLUS_ONE_MODE", "log")
+SLOW_QUERY_PARAMETERS_MAX_CHARS = 500
+
+# Drivers the async engine uses for each backend
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+psycopg"}
+
+logger = logging.getLogger("waste_app.sql")
+
+class RepeatedQueryError(RuntimeError):
+    """A request ran the same statement N_PLUS_ONE_THRESHOLD times (N_PLUS_ONE_MODE=raise)"""
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_statement(statement: str) -> str:
+    """Reduce a statement to its shape: literals, placeholders and IN lists become ?"""
+    shape = statement.replace("%s", "?")
+    shape = re.sub(r"%\(\w+\)s|:\w+", "?", shape)
+    shape = _LITERALS.sub("?", shape)
+    shape = _PLACEHOLDER_LISTS.sub("(?)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+def apply_sqlite_profile(engine, pragmas=SQLITE_PRAGMAS):
+    """Run the PRAGMA profile on every connection the engine opens"""
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def instrument_queries(engine):
+    """Time every statement for the metrics, log slow ones and watch for N+1 patterns"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "query_started", None)
+        elapsed = time.perf_counter() - started if started is not None else 0.0
+        record_query(elapsed)
+        request = current_request()
+
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            logger.warning(
+                "Slow query (%.0f ms) in %s: %s params=%.*s",
+                elapsed * 1000, request.route if request else "background", " ".join(statement.split()),
+                SLOW_QUERY_PARAMETERS_MAX_CHARS, repr(parameters)
+            )
+
+        # One executemany is a single batched round trip, not a repeat
+        if request is None or executemany or N_PLUS_ONE_MODE == "off":
+            return
+        shape = normalize_statement(statement)
+        count = request.statements.get(shape, 0) + 1
+        request.statements[shape] = count
+        if count == N_PLUS_ONE_THRESHOLD:
+            message = f"Possible N+1 in {request.route}: {count} executions of {shape}"
+            if N_PLUS_ONE_MODE == "raise":
+                raise RepeatedQueryError(message)
+            logger.warning(message)
+
+def create_database_engine(url: str = SQLALCHEMY_DATABASE_URL):
+    """Create a pooled engine for SQLite or PostgreSQL from a database URL"""
+    pool_args = {
+        "pool_size": DB_SYNC_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "poolclass": MeteredQueuePool,
+    }
+    if url.startswith("sqlite"):
+        new_engine = create_engine(url, connect_args={"check_same_thread": False}, **pool_args)
+        apply_sqlite_profile(new_engine)
+    else:
+        new_engine = create_engine(
+            url,
+            connect_args={"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"},
+            pool_pre_ping=True,
+            **pool_args
+        )
+    instrument_queries(new_engine)
+    return new_engine
+
+def create_async_database_engine(url: str = SQLALCHEMY_DATABASE_URL, pooled: bool = True):
+    """Create an AsyncEngine for the same database, with the same profile and instrumentation.
+
+    pooled=False opens a connection per session, for callers that run every
+    request on a fresh event loop (the test client).
+    """
+    url = make_url(url)
+    url = url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+    pool_args = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "poolclass": MeteredAsyncQueuePool,
+    } if pooled else {"poolclass": NullPool}
+    if url.get_backend_name() == "sqlite":
+        new_engine = create_async_engine(url, **pool_args)
+        apply_sqlite_profile(new_engine.sync_engine)
+    else:
+        new_engine = create_async_engine(
+            url,
+            connect_args={"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"},
+            pool_pre_ping=pooled,
+            **pool_args
+        )
+    instrument_queries(new_engine.sync_engine)
+    return new_engine
+
+def lock_exclusive(connection, key: int):
+    """Hold the database-wide lock named by key until the current transaction ends.
+
+    PostgreSQL takes a transaction-level advisory lock. SQLite has a single
+    writer, so the transaction takes the write lock now with BEGIN IMMEDIATE,
+    unless it has already written and holds it.
+    """
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": key})
+    elif not connection.connection.driver_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+engine = create_database_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Routes return ORM objects after committing, which must not lazy-load on an AsyncSession
+async_engine = create_async_database_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -17,3 +194,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,89 @@
+"""Streaming CSV and NDJSON exports.
+
+Rows are read with yield_per, which uses a server-side cursor on PostgreSQL
+and incremental fetches on SQLite. Each chunk of EXPORT_CHUNK_SIZE rows is
+encoded and sent before the next one is read, so memory stays flat however
+large the export is. The stream opens its own sync session because it
+outlives the request, and is iterated on the threadpool.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from . import models
+from .database import SessionLocal
+from .queries import select_collections
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def collections_export(start: datetime = None, end: datetime = None, collector_id: int = None):
+    stmt = select_collections()
+    if start is not None:
+        stmt = stmt.where(models.Collection.collected_at >= start)
+    if end is not None:
+        stmt = stmt.where(models.Collection.collected_at < end)
+    if collector_id is not None:
+        stmt = stmt.where(models.Collection.collector_id == collector_id)
+    return stmt.order_by(models.Collection.collected_at, models.Collection.id)
+
+def transactions_export(start: datetime = None, end: datetime = None, collector_id: int = None):
+    stmt = select(
+        models.Transaction.id,
+        models.Transaction.collector_id,
+        models.Transaction.transaction_type,
+        models.Transaction.amount,
+        models.Transaction.description,
+        models.Transaction.created_at
+    )
+    if start is not None:
+        stmt = stmt.where(models.Transaction.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(models.Transaction.created_at < end)
+    if collector_id is not None:
+        stmt = stmt.where(models.Transaction.collector_id == collector_id)
+    return stmt.order_by(models.Transaction.id)
+
+def _encode_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def stream_rows(stmt, fmt: str, session_factory=SessionLocal, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Yield the statement's rows as encoded CSV or NDJSON, one chunk at a time"""
+    db = session_factory()
+    try:
+        result = db.execute(stmt.execution_options(yield_per=chunk_size))
+        columns = list(result.keys())
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for partition in result.partitions():
+                writer.writerows(partition)
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue().encode("utf-8")
+        else:
+            for partition in result.partitions():
+                yield "".join(
+                    json.dumps(dict(zip(columns, map(_encode_value, row)))) + "\n"
+                    for row in partition
+                ).encode("utf-8")
+    finally:
+        db.close()
+
+def export_response(stmt, fmt: str, name: str) -> StreamingResponse:
+    return StreamingResponse(
+        stream_rows(stmt, fmt),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'}
+    )
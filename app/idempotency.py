@@ -0,0 +1,196 @@
+"""Idempotency-Key support for ledger writes.
+
+Mobile clients retry writes on flaky networks. When a write carries an
+Idempotency-Key header, the first request claims the key in the
+idempotency_keys table and stores its response in the same transaction as
+the write itself. Retries with the same key get that stored response back
+without running the write again. A duplicate that arrives while the first
+request is still running waits for it and returns the same response, so
+concurrent duplicates collapse into one execution. Completed responses are
+also kept in an in-memory LRU so most replays skip the database. Keys expire
+after IDEMPOTENCY_TTL_HOURS.
+
+A claim still unfinished after IDEMPOTENCY_LOCK_SECONDS is treated as
+abandoned, and a retry may take it over. Every claim carries an owner token,
+and a request only stores its response, and commits its write, while it still
+owns the claim. A slow first request that lost its claim is rolled back with
+409, so the write still happens once.
+
+The store runs on the event loop with an AsyncSession. The write itself is
+a plain function of a sync Session, run with AsyncSession.run_sync, so it can
+use the same ledger helpers as the maintenance commands.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from . import models
+from .aggregates import dialect_insert
+from .cache import TTLCache
+from .database import AsyncSessionLocal
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))  # How long a duplicate waits for the first request
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))  # After this an unfinished claim can be taken over
+POLL_INTERVAL_SECONDS = 0.05
+
+
+class IdempotencyStore:
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        ttl_hours: float = IDEMPOTENCY_TTL_HOURS,
+        cache_size: int = IDEMPOTENCY_CACHE_SIZE,
+        wait_seconds: float = IDEMPOTENCY_WAIT_SECONDS,
+        lock_seconds: float = IDEMPOTENCY_LOCK_SECONDS
+    ):
+        self.session_factory = session_factory
+        self.ttl = timedelta(hours=ttl_hours)
+        self.wait_seconds = wait_seconds
+        self.lock_seconds = lock_seconds
+        self.replays = 0
+        self.cache = TTLCache(cache_size, ttl_hours * 3600)
+        self._running = {}  # (collector_id, key) -> Event, for requests running in this process
+        self._lock = threading.Lock()
+
+    async def run(self, db: AsyncSession, collector_id: int, key, endpoint: str, request, execute, response_model, status_code: int = 200):
+        """Run execute() once per key and commit it with its stored response.
+
+        execute(session) performs the write on the sync Session behind db
+        without committing and returns the response object. Without a key it
+        simply runs and commits.
+        """
+        if not key:
+            result = await db.run_sync(execute)
+            await db.commit()
+            return result
+
+        request_hash = hashlib.sha256(
+            f"{endpoint}\n{request.model_dump_json()}".encode("utf-8")
+        ).hexdigest()
+        cache_key = (collector_id, key)
+        owner = uuid.uuid4().hex
+        stored = self.cache.get(cache_key) or await self._claim(collector_id, key, request_hash, owner)
+        if stored is not None:
+            return self._replay(stored, request_hash)
+
+        event = threading.Event()
+        with self._lock:
+            self._running[cache_key] = event
+        try:
+            result = await db.run_sync(execute)
+            await db.flush()
+            body = jsonable_encoder(response_model.model_validate(result))
+            still_owned = (await db.execute(
+                update(models.IdempotencyRecord).where(
+                    models.IdempotencyRecord.collector_id == collector_id,
+                    models.IdempotencyRecord.key == key,
+                    models.IdempotencyRecord.owner == owner,
+                    models.IdempotencyRecord.status_code.is_(None)
+                ).values(status_code=status_code, response_body=json.dumps(body))
+            )).rowcount
+            if not still_owned:
+                # A retry took the claim over; it runs the write instead of us
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="A retry with this Idempotency-Key took over this request"
+                )
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            await self._release(collector_id, key, owner)
+            raise
+        finally:
+            with self._lock:
+                self._running.pop(cache_key, None)
+            event.set()
+
+        self.cache.set(cache_key, (request_hash, status_code, body))
+        return result
+
+    async def _claim(self, collector_id: int, key: str, request_hash: str, owner: str):
+        """Claim the key, or return the stored (hash, status, body) of the request that owns it"""
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            now = datetime.utcnow()
+            async with self.session_factory() as db:
+                # Expired keys and abandoned claims can be reused
+                await db.execute(delete(models.IdempotencyRecord).where(
+                    models.IdempotencyRecord.expires_at <= now
+                ))
+                await db.execute(delete(models.IdempotencyRecord).where(
+                    models.IdempotencyRecord.collector_id == collector_id,
+                    models.IdempotencyRecord.key == key,
+                    models.IdempotencyRecord.status_code.is_(None),
+                    models.IdempotencyRecord.created_at <= now - timedelta(seconds=self.lock_seconds)
+                ))
+                claimed = (await db.execute(
+                    dialect_insert(db)(models.IdempotencyRecord).values(
+                        collector_id=collector_id,
+                        key=key,
+                        request_hash=request_hash,
+                        owner=owner,
+                        created_at=now,
+                        expires_at=now + self.ttl
+                    ).on_conflict_do_nothing().returning(models.IdempotencyRecord.key)
+                )).first() is not None
+                await db.commit()
+                if claimed:
+                    return None
+                record = await db.get(models.IdempotencyRecord, (collector_id, key))
+
+            if record is not None and record.status_code is not None:
+                return (record.request_hash, record.status_code, json.loads(record.response_body))
+            if record is not None and record.request_hash != request_hash:
+                return (record.request_hash, None, None)
+
+            # The first request is still running: wait for it to finish
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="A request with this Idempotency-Key is still in progress"
+                )
+            with self._lock:
+                event = self._running.get((collector_id, key))
+            if event is not None:
+                # A threading.Event, so a duplicate on another event loop or thread wakes too
+                await run_in_threadpool(event.wait, remaining)
+            else:
+                await asyncio.sleep(min(POLL_INTERVAL_SECONDS, remaining))
+
+    async def _release(self, collector_id: int, key: str, owner: str):
+        """Give up a claim after a failed write so a retry can run it again"""
+        async with self.session_factory() as db:
+            await db.execute(delete(models.IdempotencyRecord).where(
+                models.IdempotencyRecord.collector_id == collector_id,
+                models.IdempotencyRecord.key == key,
+                models.IdempotencyRecord.owner == owner,
+                models.IdempotencyRecord.status_code.is_(None)
+            ))
+            await db.commit()
+
+    def _replay(self, stored: tuple, request_hash: str):
+        stored_hash, status_code, body = stored
+        if stored_hash != request_hash:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used for a different request"
+            )
+        self.replays += 1
+        return JSONResponse(content=body, status_code=status_code, headers={"Idempotent-Replayed": "true"})
+
+
+idempotency = IdempotencyStore()
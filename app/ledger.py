@@ -0,0 +1,119 @@
+"""Recording collections against a collector's ledger.
+
+A collection is worth more than its own row: it earns a transaction, moves
+the collector's balance and feeds the per-collector stats and daily rollups.
+record_collections does all of that for any number of entries with a fixed
+number of statements, so single and batch submissions share one code path.
+
+Balances are never read and written back from Python. Every change is a
+single UPDATE relative to the stored value, and withdrawals only apply while
+the balance covers them. Concurrent writers in any number of workers cannot
+lose updates or overdraw.
+"""
+from collections import defaultdict, deque
+from datetime import datetime
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from . import models
+from .aggregates import record_category_totals, record_item_totals
+
+ITEM_NOT_FOUND = "Recyclable item not found"
+
+
+def adjust_balance(db: Session, collector_id: int, amount: float, weight_kg: float = 0.0):
+    """Atomically add to a collector's balance and collected weight"""
+    db.execute(
+        update(models.Collector)
+        .where(models.Collector.id == collector_id)
+        .values(
+            balance=models.Collector.balance + amount,
+            total_collected_kg=models.Collector.total_collected_kg + weight_kg
+        )
+    )
+
+def debit_balance(db: Session, collector_id: int, amount: float) -> bool:
+    """Atomically take amount from a collector's balance if it covers it"""
+    result = db.execute(
+        update(models.Collector)
+        .where(models.Collector.id == collector_id, models.Collector.balance >= amount)
+        .values(balance=models.Collector.balance - amount)
+    )
+    return result.rowcount == 1
+
+def record_collections(db: Session, collector_id: int, entries: list) -> list:
+    """Record CollectionCreate entries for a collector; the caller commits.
+
+    Returns one result per entry, in order: a CollectionResponse dict, or an
+    error detail string for entries that could not be recorded.
+    """
+    item_ids = {entry.item_id for entry in entries}
+    items = {
+        item.id: item
+        for item in db.query(models.RecyclableItem).filter(models.RecyclableItem.id.in_(item_ids))
+    }
+
+    collected_at = datetime.utcnow()
+    accepted, results = [], []
+    for entry in entries:
+        item = items.get(entry.item_id)
+        if item is None:
+            results.append(ITEM_NOT_FOUND)
+            continue
+        row = {
+            **entry.model_dump(),
+            "collector_id": collector_id,
+            "earned_amount": entry.weight_kg * item.price_per_kg,
+            "item_category": item.category,
+            "collected_at": collected_at
+        }
+        accepted.append((row, item))
+        results.append(row)
+    if not accepted:
+        return results
+
+    # RETURNING rows are not guaranteed to follow parameter order, and
+    # sort_by_parameter_order makes SQLite insert row by row. Rows are matched
+    # back on the columns that vary between entries instead. Entries equal on
+    # those are equal in every column, so either id fits either of them.
+    varying = [models.Collection.item_id, models.Collection.weight_kg, models.Collection.location, models.Collection.notes]
+    returned = db.execute(
+        insert(models.Collection).returning(models.Collection.id, *varying),
+        [row for row, item in accepted]
+    ).all()
+    ids_by_key = defaultdict(deque)
+    for collection_id, *key in sorted(returned):
+        ids_by_key[tuple(key)].append(collection_id)
+    ids = [
+        ids_by_key[(row["item_id"], row["weight_kg"], row["location"], row["notes"])].popleft()
+        for row, item in accepted
+    ]
+    db.execute(insert(models.Transaction), [
+        {
+            "collector_id": collector_id,
+            "transaction_type": "collection",
+            "amount": row["earned_amount"],
+            "description": f"Collected {row['weight_kg']}kg of {item.name}",
+            "created_at": collected_at
+        }
+        for row, item in accepted
+    ])
+
+    # One balance update and one upsert per aggregate table, however many entries
+    by_category = defaultdict(lambda: [0, 0.0, 0.0])
+    by_item = defaultdict(lambda: [0, 0.0, 0.0])
+    for (row, item), collection_id in zip(accepted, ids):
+        row.update(id=collection_id, item_name=item.name)
+        for totals in (by_category[item.category], by_item[item.id]):
+            totals[0] += 1
+            totals[1] += row["weight_kg"]
+            totals[2] += row["earned_amount"]
+
+    adjust_balance(
+        db,
+        collector_id,
+        sum(totals[2] for totals in by_category.values()),
+        sum(totals[1] for totals in by_category.values())
+    )
+    record_category_totals(db, collector_id, by_category)
+    record_item_totals(db, collected_at.date(), collector_id, by_item)
+    return results
@@ -1,8 +1,20 @@
 print("--- LOADING APP.MAIN ---")
+from contextlib import asynccontextmanager
+from datetime import datetime
+from anyio import to_thread
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from .database import engine, Base
+from fastapi.responses import PlainTextResponse
+from .database import async_engine, engine, THREADPOOL_SIZE
+from .migrate import run_migrations
+from .query_log import query_log
+from .passwords import password_hasher
+from .revocation import revocations
+from .pagination import NEXT_CURSOR_HEADER
+from .compression import CompressionMiddleware, PrecompressedStaticFiles
+from .metrics import MetricsMiddleware, register_sampled, render as render_metrics
+from .auth import principal_cache
+from .catalog import catalog
 from .routers import collectors, citizen, admin
 import logging
 from logging.handlers import RotatingFileHandler
@@ -26,12 +38,13 @@ logging.basicConfig(
 logger = logging.getLogger("waste_app")
 
 # --- Database Setup ---
-Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 # --- Seed Database with Enhanced Recyclable Items ---
 def seed_recyclable_items():
     """Populate the database with common recyclable items and prices."""
     from .database import SessionLocal
+    from .catalog_import import import_catalog
     from . import models
     
     db = SessionLocal()
@@ -137,17 +150,67 @@ def seed_recyclable_items():
         },
     ]
     
-    for item_data in items:
-        db_item = models.RecyclableItem(**item_data)
-        db.add(db_item)
-    
-    db.commit()
-    db.close()
-    logger.info(f"Successfully seeded {len(items)} recyclable items into database")
+    try:
+        result = import_catalog(db, items)
+    finally:
+        db.close()
+    logger.info(f"Successfully seeded {result['created']} recyclable items into database")
 
 # Seed the database
 seed_recyclable_items()
 
+# --- Metrics ---
+def _cache_stats(key):
+    caches = {"principal": principal_cache, "catalog": catalog}
+    return lambda: {name: cache.stats()[key] for name, cache in caches.items()}
+
+def _pool_stats(read):
+    pools = {"async": async_engine.pool, "sync": engine.pool}
+    return lambda: {name: read(pool) for name, pool in pools.items()}
+
+register_sampled("db_pool_size", "Connections each pool keeps open.", _pool_stats(lambda pool: pool.size()), label="engine")
+register_sampled(
+    "db_pool_checked_out", "Connections currently checked out.", _pool_stats(lambda pool: pool.checkedout()), label="engine"
+)
+register_sampled("db_pool_checked_in", "Idle connections in each pool.", _pool_stats(lambda pool: pool.checkedin()), label="engine")
+register_sampled("password_hash_in_flight", "bcrypt calls running or queued.", lambda: password_hasher.stats()["in_flight"])
+register_sampled("password_hash_max_pending", "bcrypt calls allowed before 503s.", lambda: password_hasher.max_pending)
+register_sampled("password_hash_bcrypt_rounds", "bcrypt cost factor in use.", lambda: password_hasher.stats()["bcrypt_rounds"])
+register_sampled(
+    "password_hash_completed_total", "bcrypt calls completed.",
+    lambda: password_hasher.stats()["completed"], kind="counter"
+)
+register_sampled(
+    "password_hash_rejected_total", "bcrypt calls rejected with 503.",
+    lambda: password_hasher.stats()["rejected"], kind="counter"
+)
+register_sampled(
+    "password_hash_pool_restarts_total", "bcrypt worker pools replaced after a worker died.",
+    lambda: password_hasher.stats()["restarts"], kind="counter"
+)
+register_sampled("cache_entries", "Entries held by each in-process cache.", _cache_stats("size"), label="cache")
+register_sampled("cache_hits_total", "Reads each cache answered.", _cache_stats("hits"), label="cache", kind="counter")
+register_sampled(
+    "cache_misses_total", "Reads each cache could not answer.", _cache_stats("misses"), label="cache", kind="counter"
+)
+register_sampled("revocation_list_entries", "Revoked tokens and banned users held in memory.", lambda: len(revocations))
+register_sampled("search_log_pending", "Searches waiting to be written.", lambda: query_log.pending)
+register_sampled(
+    "search_log_dropped_total", "Searches dropped because the buffer was full.", lambda: query_log.dropped, kind="counter"
+)
+
+# --- App Lifecycle ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Threads for blocking calls made from the async routes (bcrypt waits, uploads, catalog reloads)
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    yield
+    await async_engine.dispose()
+    # Write out any citizen searches still waiting in the log buffer
+    query_log.stop()
+    password_hasher.shutdown()
+    revocations.stop()
+
 # --- App Setup ---
 app = FastAPI(
     title="Waste Sorting & Recycling Optimization API",
@@ -156,14 +219,23 @@ app = FastAPI(
     contact={
         "name": "Waste Management Team",
         "email": "support@wasteapp.tn"
-    }
+    },
+    lifespan=lifespan
 )
 
-# Static Files (Images)
+# Static Files (Images), served with their precompressed .br/.gz variants
 static_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
 if not os.path.exists(static_dir):
     os.makedirs(static_dir)
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
+app.mount("/static", PrecompressedStaticFiles(directory=static_dir), name="static")
+
+# Frontend pages, same origin as the API
+frontend_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend")
+if os.path.exists(frontend_dir):
+    app.mount("/frontend", PrecompressedStaticFiles(directory=frontend_dir, html=True), name="frontend")
+
+# Compression (gzip, or Brotli when installed) for responses above COMPRESSION_MINIMUM_SIZE
+app.add_middleware(CompressionMiddleware)
 
 # CORS Middleware
 app.add_middleware(
@@ -173,15 +245,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "Idempotent-Replayed"],
 )
 
+# Request metrics, outermost so the latency covers every other middleware
+app.add_middleware(MetricsMiddleware)
+
 # --- Include Routers ---
 app.include_router(collectors.router)
 app.include_router(citizen.router)
 app.include_router(admin.router)
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {
         "message": "Welcome to the Waste Sorting & Recycling Optimization API",
         "version": "2.0.0",
@@ -194,5 +270,14 @@ def read_root():
     }
 
 @app.get("/health")
-def health_check():
-    return {"status": "healthy", "timestamp": "2025-01-17"}
\ No newline at end of file
+async def health_check():
+    return {
+        "status": "healthy",
+        "timestamp": datetime.utcnow().isoformat(),
+        "password_hashing": password_hasher.stats()
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics in the text exposition format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,133 @@
+"""Maintenance commands.
+
+Usage: python -m app.manage <command>
+"""
+import argparse
+import os
+import sys
+from .database import SessionLocal, engine
+from .aggregates import rebuild_collector_stats, rebuild_daily_rollups
+from .migrate import run_migrations
+from .query_plans import full_scans
+from .reconciliation import reconcile_ledgers
+from .catalog_import import CatalogImportError, import_catalog, parse_catalog
+from .compression import brotli, compress_static
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def migrate(args):
+    # Migrations already ran before the command was dispatched
+    print("Database schema is up to date")
+
+def check_plans(args):
+    with engine.connect() as connection:
+        problems = full_scans(connection)
+    for name, plan in problems.items():
+        print(f"FULL SCAN in '{name}':")
+        for line in plan:
+            print(f"    {line}")
+    if problems:
+        sys.exit(1)
+    print("All hot queries use an index")
+
+def rebuild_stats(args):
+    db = SessionLocal()
+    try:
+        count = rebuild_collector_stats(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"Rebuilt collector_category_stats ({count} rows)")
+
+def rebuild_rollups(args):
+    db = SessionLocal()
+    try:
+        count = rebuild_daily_rollups(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"Rebuilt daily_item_rollups ({count} rows)")
+
+def reconcile(args):
+    db = SessionLocal()
+    try:
+        report = reconcile_ledgers(db, full=args.full)
+        print(
+            f"Checked {report['transactions_checked']} transactions "
+            f"for {report['collectors_checked']} collectors"
+        )
+        for checkpoint in report["drifted"]:
+            print(
+                f"DRIFT collector {checkpoint.collector_id}: balance {checkpoint.balance:.2f}, "
+                f"drift {checkpoint.drift:+.2f}"
+            )
+        drifted = bool(report["drifted"])
+    finally:
+        db.close()
+    if drifted:
+        sys.exit(1)
+
+def import_items(args):
+    fmt = args.format or args.path.rsplit(".", 1)[-1].lower()
+    with open(args.path, "rb") as catalog_file:
+        content = catalog_file.read()
+    db = SessionLocal()
+    try:
+        result = import_catalog(db, parse_catalog(content, fmt))
+    except CatalogImportError as exc:
+        for error in exc.errors:
+            print(f"row {error['row']}: {error['detail']}" if error["row"] else error["detail"])
+        sys.exit(1)
+    finally:
+        db.close()
+    print(f"Catalog imported: {result['created']} created, {result['updated']} updated, {result['unchanged']} unchanged")
+
+def compress_assets(args):
+    directories = args.directories or [os.path.join(PROJECT_DIR, "static"), os.path.join(PROJECT_DIR, "frontend")]
+    written = compress_static(directories)
+    print(f"Wrote {len(written)} precompressed files")
+    if brotli is None:
+        print("brotli is not installed; only .gz variants were written")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.manage", description="Waste API maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser(
+        "migrate", help="Create missing tables and apply pending migrations"
+    ).set_defaults(handler=migrate)
+    subparsers.add_parser(
+        "check-plans", help="Fail if a hot query would need a full table scan"
+    ).set_defaults(handler=check_plans)
+    subparsers.add_parser(
+        "rebuild-stats", help="Recompute per-collector category stats from collections"
+    ).set_defaults(handler=rebuild_stats)
+    subparsers.add_parser(
+        "rebuild-rollups", help="Recompute the admin dashboard's daily rollups from collections"
+    ).set_defaults(handler=rebuild_rollups)
+    reconcile_parser = subparsers.add_parser(
+        "reconcile", help="Check collector balances against transactions added since the last run"
+    )
+    reconcile_parser.add_argument("--full", action="store_true", help="Drop the checkpoints and check the whole history")
+    reconcile_parser.set_defaults(handler=reconcile)
+    import_parser = subparsers.add_parser(
+        "import-catalog", help="Create or update recyclable items from a CSV or JSON file"
+    )
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=["csv", "json"], help="Defaults to the file extension")
+    import_parser.set_defaults(handler=import_items)
+    compress_parser = subparsers.add_parser(
+        "compress-static", help="Write .gz/.br variants of static and frontend text assets (build step)"
+    )
+    compress_parser.add_argument("directories", nargs="*", help="Defaults to static/ and frontend/")
+    compress_parser.set_defaults(handler=compress_assets, needs_database=False)
+
+    args = parser.parse_args(argv)
+    if getattr(args, "needs_database", True):
+        for version in run_migrations(engine):
+            print(f"Applied migration {version:04d}")
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
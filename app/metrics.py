@@ -0,0 +1,250 @@
+"""Prometheus metrics, served as text from /metrics.
+
+Request latency is recorded per route template and status by MetricsMiddleware.
+SQL statements are counted and timed per request by the cursor events in
+database.py, and pool checkouts report how long they waited for a connection.
+Figures the bcrypt pool, the caches and the search log buffer already keep are
+read from them at scrape time.
+
+Recording is lock-free on the hot path. Every thread adds to its own shard of
+each metric, and a scrape sums the shards. The lock is only taken when a thread
+records its first sample and while a scrape walks the shard list.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+class _ShardedMetric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _series(self, label_values: tuple) -> list:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        series = shard.get(label_values)
+        if series is None:
+            series = shard[label_values] = self._new_series()
+        return series
+
+    def collect(self) -> dict:
+        """Label values -> series, summed over every thread's shard"""
+        with self._lock:
+            shards = list(self._shards)
+        merged = {}
+        for shard in shards:
+            for label_values, series in list(shard.items()):
+                total = merged.setdefault(label_values, self._new_series())
+                for index, value in enumerate(series):
+                    total[index] += value
+        return merged
+
+    def _label_text(self, label_values: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, series in sorted(self.collect().items()):
+            lines.extend(self._render_series(label_values, series))
+        return lines
+
+
+class Counter(_ShardedMetric):
+    kind = "counter"
+
+    def _new_series(self) -> list:
+        return [0.0]
+
+    def inc(self, amount: float = 1.0):
+        self._series(())[0] += amount
+
+    def _render_series(self, label_values, series):
+        return [f"{self.name}{self._label_text(label_values)} {_number(series[0])}"]
+
+
+class Histogram(_ShardedMetric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def _new_series(self) -> list:
+        # One count per bucket, one for +Inf, then the sum
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value: float, *label_values):
+        series = self._series(label_values)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def _render_series(self, label_values, series):
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+            cumulative += count
+            le = f'le="{bound}"' if bound == "+Inf" else f'le="{_number(bound)}"'
+            lines.append(f"{self.name}_bucket{self._label_text(label_values, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(label_values)} {_number(series[-1])}")
+        lines.append(f"{self.name}_count{self._label_text(label_values)} {cumulative}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# --- Metrics ---
+request_latency = Histogram(
+    "http_request_duration_seconds", "Request latency by route template and status.",
+    ("method", "route", "status")
+)
+request_queries = Histogram(
+    "http_request_db_queries", "SQL statements executed per request.",
+    ("method", "route"), QUERY_COUNT_BUCKETS
+)
+request_query_time = Histogram(
+    "http_request_db_seconds", "Time spent in SQL statements per request.",
+    ("method", "route")
+)
+queries_total = Counter("db_queries_total", "SQL statements executed, in requests or not.")
+query_seconds_total = Counter("db_query_seconds_total", "Time spent executing SQL statements.")
+pool_wait = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.",
+    buckets=POOL_WAIT_BUCKETS
+)
+
+# Values other objects already keep, read from them at scrape time
+_sampled = []
+
+def register_sampled(name: str, documentation: str, read, label: str = None, kind: str = "gauge"):
+    """Add a metric sampled by read(): a number, or {label value: number} when `label` is set"""
+    _sampled.append((name, documentation, read, label, kind))
+
+
+# --- Request Instrumentation ---
+class RequestStats:
+    __slots__ = ("scope", "queries", "query_time", "statements")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.queries = 0
+        self.query_time = 0.0
+        self.statements = {}  # Normalized SQL -> executions, for the repeated-query check
+
+    @property
+    def route(self) -> str:
+        return f"{self.scope.get('method', '')} {route_label(self.scope)}".strip()
+
+_request_stats: ContextVar = ContextVar("request_stats", default=None)
+
+def current_request():
+    """Stats of the request being handled, or None outside a request"""
+    return _request_stats.get()
+
+
+def route_label(scope) -> str:
+    route = getattr(scope.get("route"), "path", None)
+    if route is not None:
+        return route
+    # Mounted apps such as /static only leave their prefix behind
+    if scope.get("root_path", "") != scope.get("app_root_path", ""):
+        return scope["root_path"]
+    # Unmatched paths share one label so scanners cannot blow up the series count
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Time each request and its SQL, labelled by the matched route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = RequestStats(scope)
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_stats.reset(token)
+            route = route_label(scope)
+            method = scope["method"]
+            request_latency.observe(elapsed, method, route, str(status))
+            request_queries.observe(stats.queries, method, route)
+            request_query_time.observe(stats.query_time, method, route)
+
+
+def record_query(elapsed: float):
+    """Count one statement, charging it to the current request if any"""
+    queries_total.inc()
+    query_seconds_total.inc(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_time += elapsed
+
+
+class _MeteredCheckout:
+    """Pool mixin recording how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait.observe(time.perf_counter() - start)
+
+class MeteredQueuePool(_MeteredCheckout, QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+class MeteredAsyncQueuePool(_MeteredCheckout, AsyncAdaptedQueuePool):
+    """The async engine's pool, metered the same way"""
+
+
+# --- Exposition ---
+def render() -> str:
+    lines = []
+    for metric in (request_latency, request_queries, request_query_time, queries_total, query_seconds_total, pool_wait):
+        lines.extend(metric.render())
+    for name, documentation, read, label, kind in _sampled:
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {kind}")
+        if label is None:
+            lines.append(f"{name} {_number(read())}")
+        else:
+            lines.extend(f'{name}{{{label}="{_escape(key)}"}} {_number(value)}' for key, value in read().items())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,61 @@
+"""Versioned, idempotent schema migrations.
+
+Tables that do not exist yet are created from the models, then every script
+in app/migrations whose version is not recorded in schema_migrations is
+applied in its own transaction. Scripts must be safe to re-run, so a
+half-upgraded database can always be migrated again.
+
+Every worker migrates on startup. Each step holds a database lock and
+re-checks schema_migrations under it, so workers starting together apply
+each script once and the others wait for it.
+"""
+import importlib
+import logging
+import pkgutil
+from datetime import datetime
+from sqlalchemy import insert, select
+from sqlalchemy.engine import Engine
+from . import models
+from .database import Base, engine as default_engine, lock_exclusive
+
+logger = logging.getLogger("waste_app.migrate")
+
+MIGRATIONS_PACKAGE = "app.migrations"
+MIGRATION_LOCK_KEY = 7302  # PostgreSQL advisory lock id
+
+
+def discover_migrations():
+    """Return [(version, name, module)] for every migration script, in order"""
+    package = importlib.import_module(MIGRATIONS_PACKAGE)
+    migrations = []
+    for module_info in pkgutil.iter_modules(package.__path__):
+        version, _, name = module_info.name.partition("_")
+        if not version.isdigit():
+            continue
+        module = importlib.import_module(f"{MIGRATIONS_PACKAGE}.{module_info.name}")
+        migrations.append((int(version), name, module))
+    return sorted(migrations, key=lambda migration: migration[0])
+
+def run_migrations(engine: Engine = default_engine):
+    """Bring the database schema up to date, returns the versions applied"""
+    with engine.begin() as connection:
+        lock_exclusive(connection, MIGRATION_LOCK_KEY)
+        Base.metadata.create_all(bind=connection)
+        applied = set(connection.execute(select(models.SchemaMigration.version)).scalars())
+
+    newly_applied = []
+    for version, name, module in discover_migrations():
+        if version in applied:
+            continue
+        with engine.begin() as connection:
+            lock_exclusive(connection, MIGRATION_LOCK_KEY)
+            # Another worker may have applied it while this one waited
+            if connection.scalar(select(models.SchemaMigration.version).where(models.SchemaMigration.version == version)):
+                continue
+            module.upgrade(connection)
+            connection.execute(insert(models.SchemaMigration).values(
+                version=version, name=name, applied_at=datetime.utcnow()
+            ))
+        logger.info(f"Applied migration {version:04d} {name}")
+        newly_applied.append(version)
+    return newly_applied
@@ -0,0 +1,15 @@
+"""Composite indexes for the hot collector, admin and citizen queries."""
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_collections_collector_collected ON collections (collector_id, collected_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_collections_collected ON collections (collected_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_collections_item ON collections (item_id)",
+    "CREATE INDEX IF NOT EXISTS ix_transactions_collector_created ON transactions (collector_id, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_collectors_role_id ON collectors (role, id)",
+    "CREATE INDEX IF NOT EXISTS ix_citizen_queries_created ON citizen_queries (created_at)",
+]
+
+
+def upgrade(connection):
+    for statement in INDEXES:
+        connection.exec_driver_sql(statement)
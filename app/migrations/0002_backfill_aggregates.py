@@ -0,0 +1,18 @@
+"""Fill the collector stats and dashboard rollup tables on databases that
+already had collections before those tables existed."""
+from sqlalchemy import func, inspect, select
+from sqlalchemy.orm import Session
+from .. import models
+from ..aggregates import rebuild_collector_stats, rebuild_daily_rollups
+
+
+def upgrade(connection):
+    db = Session(bind=connection)
+    if db.execute(select(func.count()).select_from(models.Collection)).scalar() == 0:
+        return
+    # Databases without collections.item_category get their stats from 0005
+    columns = {column["name"] for column in inspect(connection).get_columns("collections")}
+    if "item_category" in columns and db.execute(select(func.count()).select_from(models.CollectorCategoryStats)).scalar() == 0:
+        rebuild_collector_stats(db)
+    if db.execute(select(func.count()).select_from(models.DailyItemRollup)).scalar() == 0:
+        rebuild_daily_rollups(db)
@@ -0,0 +1,8 @@
+"""Owner token on idempotency claims, so a taken-over claim cannot commit twice."""
+from sqlalchemy import inspect
+
+
+def upgrade(connection):
+    columns = {column["name"] for column in inspect(connection).get_columns("idempotency_keys")}
+    if "owner" not in columns:
+        connection.exec_driver_sql("ALTER TABLE idempotency_keys ADD COLUMN owner VARCHAR")
@@ -0,0 +1,15 @@
+"""Split each (day, item) dashboard rollup over several rows keyed by shard."""
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+from .. import models
+from ..aggregates import rebuild_daily_rollups
+
+
+def upgrade(connection):
+    columns = {column["name"] for column in inspect(connection).get_columns("daily_item_rollups")}
+    if "shard" in columns:
+        return
+    # The primary key changes, so the table is recreated and refilled from collections
+    models.DailyItemRollup.__table__.drop(connection)
+    models.DailyItemRollup.__table__.create(connection)
+    rebuild_daily_rollups(Session(bind=connection))
@@ -0,0 +1,22 @@
+"""Keep each collection's item category, so the collector stats and a rebuild
+of them count a collection under the same category."""
+from sqlalchemy import func, inspect, select
+from sqlalchemy.orm import Session
+from .. import models
+from ..aggregates import rebuild_collector_stats
+
+
+def upgrade(connection):
+    columns = {column["name"] for column in inspect(connection).get_columns("collections")}
+    if "item_category" not in columns:
+        connection.exec_driver_sql("ALTER TABLE collections ADD COLUMN item_category VARCHAR")
+    # The category at collection time is lost for older rows, so they take
+    # their item's current one and the stats are recomputed to match
+    connection.exec_driver_sql(
+        "UPDATE collections SET item_category = "
+        "(SELECT category FROM recyclable_items WHERE recyclable_items.id = collections.item_id) "
+        "WHERE item_category IS NULL"
+    )
+    db = Session(bind=connection)
+    if db.execute(select(func.count()).select_from(models.Collection)).scalar():
+        rebuild_collector_stats(db)
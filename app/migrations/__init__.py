@@ -0,0 +1,2 @@
+# Versioned migration scripts, applied in order by app.migrate.
+# Each module is named NNNN_description.py and defines upgrade(connection).
@@ -1,10 +1,13 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Text, Boolean, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
 
 class Collector(Base):
     __tablename__ = "collectors"
+    __table_args__ = (
+        Index("ix_collectors_role_id", "role", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True, nullable=False)
@@ -37,6 +40,11 @@ class RecyclableItem(Base):
 
 class Collection(Base):
     __tablename__ = "collections"
+    __table_args__ = (
+        Index("ix_collections_collector_collected", "collector_id", "collected_at", "id"),
+        Index("ix_collections_collected", "collected_at", "id"),
+        Index("ix_collections_item", "item_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     collector_id = Column(Integer, ForeignKey("collectors.id"), nullable=False)
@@ -46,6 +54,7 @@ class Collection(Base):
     location = Column(String)
     notes = Column(Text)
     collected_at = Column(DateTime, default=datetime.utcnow)
+    item_category = Column(String)  # The item's category when collected; stats are counted under it
     
     # Relationships
     collector = relationship("Collector", back_populates="collections")
@@ -53,6 +62,9 @@ class Collection(Base):
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_transactions_collector_created", "collector_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     collector_id = Column(Integer, ForeignKey("collectors.id"), nullable=False)
@@ -66,8 +78,96 @@ class Transaction(Base):
 
 class CitizenQuery(Base):
     __tablename__ = "citizen_queries"
+    __table_args__ = (
+        Index("ix_citizen_queries_created", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     query_text = Column(String, nullable=False)
     result_count = Column(Integer, default=0)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class CatalogVersion(Base):
+    __tablename__ = "catalog_version"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)  # Bumped on every catalog write
+
+class CollectorCategoryStats(Base):
+    __tablename__ = "collector_category_stats"
+    
+    collector_id = Column(Integer, ForeignKey("collectors.id"), primary_key=True)
+    category = Column(String, primary_key=True)
+    collection_count = Column(Integer, nullable=False, default=0)
+    total_weight_kg = Column(Float, nullable=False, default=0.0)
+    total_earned = Column(Float, nullable=False, default=0.0)
+
+class DailyItemRollup(Base):
+    __tablename__ = "daily_item_rollups"
+    
+    day = Column(Date, primary_key=True)  # UTC date of collected_at
+    item_id = Column(Integer, ForeignKey("recyclable_items.id"), primary_key=True)
+    shard = Column(Integer, primary_key=True, default=0)  # collector_id % ROLLUP_SHARDS
+    collection_count = Column(Integer, nullable=False, default=0)
+    total_weight_kg = Column(Float, nullable=False, default=0.0)
+    total_revenue = Column(Float, nullable=False, default=0.0)
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+    
+    version = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    __table_args__ = (
+        Index("ix_refresh_tokens_collector", "collector_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    token_hash = Column(String, unique=True, nullable=False)  # SHA-256 of the token handed out
+    collector_id = Column(Integer, ForeignKey("collectors.id"), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, nullable=True)  # Set when rotated, logged out or banned
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class TokenRevocation(Base):
+    __tablename__ = "token_revocations"
+    __table_args__ = (
+        Index("ix_token_revocations_expires", "expires_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String, nullable=True)  # A single access token (logout)
+    collector_id = Column(Integer, nullable=True)  # Every access token issued to this collector before revoked_at (ban)
+    revoked_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)  # No affected access token is valid after this
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        Index("ix_idempotency_keys_expires", "expires_at"),
+    )
+    
+    collector_id = Column(Integer, primary_key=True)  # Keys are scoped to the collector that sent them
+    key = Column(String, primary_key=True)
+    request_hash = Column(String, nullable=False)  # Endpoint and body of the first request
+    owner = Column(String, nullable=True)  # Token of the request holding the claim
+    status_code = Column(Integer, nullable=True)  # Null while the first request is still running
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+class LedgerCheckpoint(Base):
+    __tablename__ = "ledger_checkpoints"
+    
+    collector_id = Column(Integer, ForeignKey("collectors.id"), primary_key=True)
+    last_transaction_id = Column(Integer, nullable=False, default=0)  # Transactions up to here are in ledger_sum
+    ledger_sum = Column(Float, nullable=False, default=0.0)
+    balance = Column(Float, nullable=False, default=0.0)  # Balance seen at the last check
+    drift = Column(Float, nullable=False, default=0.0)  # balance minus what the ledger says it should be
+    checked_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Updates only apply WHERE last_transaction_id is still the value read
+    __mapper_args__ = {"version_id_col": last_transaction_id, "version_id_generator": False}
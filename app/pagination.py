@@ -0,0 +1,49 @@
+"""Opaque cursors for keyset pagination.
+
+A cursor encodes the sort key of the last row of a page. The next page seeks
+past it through an index instead of skipping rows with OFFSET, so every page
+costs the same no matter how deep the client goes. List endpoints keep their
+response body and return the cursor for the next page in the X-Next-Cursor
+header.
+"""
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, or_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values) -> str:
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, *types) -> tuple:
+    """Decode a cursor into values of the given types (datetime or int)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if len(payload) != len(types):
+            raise ValueError("Wrong number of cursor values")
+        return tuple(
+            datetime.fromisoformat(value) if kind is datetime else kind(value)
+            for kind, value in zip(types, payload)
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def seek_descending(sort_column, id_column, sort_value, last_id):
+    """Filter for rows after (sort_value, last_id) in (sort DESC, id DESC) order"""
+    return and_(
+        sort_column <= sort_value,
+        or_(sort_column < sort_value, id_column < last_id)
+    )
+
+def set_next_cursor(response: Response, rows: list, limit: int, *keys):
+    """Expose the cursor for the next page when this page came back full"""
+    if rows and len(rows) == limit:
+        last = rows[-1]
+        values = [last[key] if isinstance(last, dict) else getattr(last, key) for key in keys]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*values)
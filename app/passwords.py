@@ -0,0 +1,123 @@
+"""Password hashing on a dedicated, bounded process pool.
+
+bcrypt spends hundreds of milliseconds of CPU per call. Running it in the
+request thread during a login rush starves every other endpoint, so hashing
+and verification are handed to PASSWORD_HASH_WORKERS worker processes.
+At most PASSWORD_HASH_MAX_PENDING calls may be running or queued at once;
+beyond that the request fails fast with 503 instead of piling up. If a
+worker dies and breaks the pool, a new pool is started and the call retried.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+from fastapi import HTTPException, status
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))  # 0 hashes in the calling thread
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+PASSWORD_HASH_RETRY_AFTER = 1  # Seconds, sent with the 503
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def _verify(password: str, hashed_password: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+    except Exception:
+        return False
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        rounds: int = BCRYPT_ROUNDS,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING
+    ):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def hash(self, password: str) -> str:
+        """Hash a password with the configured cost factor"""
+        return self._run(_hash, password, self.rounds)
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        """Check a password against a stored hash"""
+        return self._run(_verify, password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "bcrypt_rounds": self.rounds,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self.in_flight >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many password operations in progress, try again shortly",
+                    headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)},
+                )
+            self.in_flight += 1
+            executor = self._get_executor()
+        try:
+            if executor is None:
+                result = fn(*args)
+            else:
+                try:
+                    result = executor.submit(fn, *args).result()
+                except BrokenProcessPool:
+                    # A worker died (killed, out of memory); hashing is safe to redo
+                    result = self._replace_executor(executor).submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.completed += 1
+        return result
+
+    def _get_executor(self):
+        # Called with _lock held
+        if self.workers > 0 and self._executor is None:
+            # Spawned workers do not inherit the server's threads or open connections
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _replace_executor(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """Swap a broken pool for a new one, unless another call already did"""
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+                self.restarts += 1
+            executor = self._get_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+        return executor
+
+
+password_hasher = PasswordHasher()
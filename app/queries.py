@@ -0,0 +1,58 @@
+"""Shared read queries used by the collector and admin listing endpoints."""
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from . import models
+from .pagination import seek_descending
+
+
+def select_schema(schema: type[BaseModel], model):
+    """Select exactly the model columns a response schema exposes, in schema order"""
+    return select(*(getattr(model, name) for name in schema.model_fields))
+
+def select_collections():
+    """Collections joined with their item name in one statement"""
+    return select(
+        models.Collection.id,
+        models.Collection.collector_id,
+        models.Collection.item_id,
+        models.Collection.weight_kg,
+        models.Collection.earned_amount,
+        models.Collection.location,
+        models.Collection.notes,
+        models.Collection.collected_at,
+        models.RecyclableItem.name.label("item_name"),
+        models.Collection.item_category
+    ).outerjoin(
+        models.RecyclableItem, models.RecyclableItem.id == models.Collection.item_id
+    )
+
+def collections_page(collector_id: int = None, skip: int = 0, limit: int = 50, after: tuple = None):
+    """Statement for a page of collections, newest first.
+
+    `after` is a decoded (collected_at, id) cursor; when given, `skip` is ignored.
+    """
+    stmt = select_collections()
+    if collector_id is not None:
+        stmt = stmt.where(models.Collection.collector_id == collector_id)
+    if after is not None:
+        stmt = stmt.where(seek_descending(
+            models.Collection.collected_at, models.Collection.id, *after
+        ))
+    else:
+        stmt = stmt.offset(skip)
+    return stmt.order_by(
+        models.Collection.collected_at.desc(),
+        models.Collection.id.desc()
+    ).limit(limit)
+
+def list_collections(db: Session, collector_id: int = None, skip: int = 0, limit: int = 50, after: tuple = None):
+    """Return a page of collections as CollectionResponse rows"""
+    stmt = collections_page(collector_id=collector_id, skip=skip, limit=limit, after=after)
+    return [row._asdict() for row in db.execute(stmt)]
+
+async def list_collections_async(db: AsyncSession, collector_id: int = None, skip: int = 0, limit: int = 50, after: tuple = None):
+    """list_collections() for async routes"""
+    stmt = collections_page(collector_id=collector_id, skip=skip, limit=limit, after=after)
+    return [row._asdict() for row in await db.execute(stmt)]
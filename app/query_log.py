@@ -0,0 +1,120 @@
+"""Write-behind buffer for citizen search logging.
+
+Search requests only append to an in-memory queue. A background thread writes
+the queued rows with one multi-row INSERT when QUERY_LOG_BATCH_SIZE rows are
+waiting or every QUERY_LOG_FLUSH_MS milliseconds. When more than
+QUERY_LOG_MAX_PENDING rows are waiting, new entries are dropped and counted
+instead of slowing the request down.
+"""
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from sqlalchemy import insert
+from . import models
+from .database import SessionLocal
+
+QUERY_LOG_MAX_PENDING = int(os.getenv("QUERY_LOG_MAX_PENDING", "10000"))
+QUERY_LOG_BATCH_SIZE = int(os.getenv("QUERY_LOG_BATCH_SIZE", "500"))
+QUERY_LOG_FLUSH_MS = int(os.getenv("QUERY_LOG_FLUSH_MS", "1000"))
+
+logger = logging.getLogger("waste_app.query_log")
+
+
+class QueryLogBuffer:
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        max_pending: int = QUERY_LOG_MAX_PENDING,
+        batch_size: int = QUERY_LOG_BATCH_SIZE,
+        flush_interval_ms: int = QUERY_LOG_FLUSH_MS
+    ):
+        self.session_factory = session_factory
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.dropped = 0
+        self.written = 0
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def record(self, query_text: str, result_count: int) -> bool:
+        """Queue one search for logging. Returns False if it was dropped."""
+        row = {
+            "query_text": query_text,
+            "result_count": result_count,
+            "created_at": datetime.utcnow()
+        }
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending.append(row)
+            batch_ready = len(self._pending) >= self.batch_size
+
+        if self._thread is None:
+            self.start()
+        if batch_ready:
+            self._wakeup.set()
+        return True
+
+    def flush(self):
+        """Write everything queued so far, one INSERT per batch"""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    count = min(self.batch_size, len(self._pending))
+                    batch = [self._pending.popleft() for _ in range(count)]
+                if not batch:
+                    return
+
+                db = self.session_factory()
+                try:
+                    db.execute(insert(models.CitizenQuery).values(batch))
+                    db.commit()
+                    with self._lock:
+                        self.written += len(batch)
+                except Exception:
+                    db.rollback()
+                    with self._lock:
+                        self.dropped += len(batch)
+                    logger.exception(f"Dropped {len(batch)} citizen query log rows")
+                    return
+                finally:
+                    db.close()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the writer thread and flush whatever is still queued"""
+        thread = self._thread
+        if thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+query_log = QueryLogBuffer()
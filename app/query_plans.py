@@ -0,0 +1,68 @@
+"""EXPLAIN QUERY PLAN checks for the hot queries.
+
+Each entry builds the statement an endpoint actually runs. The check fails
+when SQLite would answer one of them with a full table scan, which is how a
+missing or unusable index shows up before it reaches production.
+"""
+from datetime import datetime
+from sqlalchemy import func, select
+from sqlalchemy.engine import Connection
+from . import models
+from .queries import collections_page
+from .pagination import seek_descending
+
+SAMPLE_TIME = datetime(2026, 1, 1)
+
+
+def hot_queries():
+    return {
+        "login by username": select(models.Collector).where(
+            models.Collector.username == "ali_barbecha"
+        ),
+        "collector collections page": collections_page(collector_id=1),
+        "collector collections cursor": collections_page(collector_id=1, after=(SAMPLE_TIME, 100)),
+        "recent collections": collections_page(),
+        "collections today": select(func.count(models.Collection.id)).where(
+            models.Collection.collected_at >= SAMPLE_TIME,
+            models.Collection.collected_at < SAMPLE_TIME.replace(day=2)
+        ),
+        "item has collections": select(models.Collection.id).where(
+            models.Collection.item_id == 1
+        ).limit(1),
+        "collector transactions cursor": select(models.Transaction).where(
+            models.Transaction.collector_id == 1,
+            seek_descending(models.Transaction.created_at, models.Transaction.id, SAMPLE_TIME, 100)
+        ).order_by(
+            models.Transaction.created_at.desc(), models.Transaction.id.desc()
+        ).limit(50),
+        "users by role": select(models.Collector).where(
+            models.Collector.role == "collector", models.Collector.id > 100
+        ).order_by(models.Collector.id).limit(100),
+        "collector stats": select(models.CollectorCategoryStats).where(
+            models.CollectorCategoryStats.collector_id == 1
+        ),
+        "citizen queries since": select(func.count(models.CitizenQuery.id)).where(
+            models.CitizenQuery.created_at >= SAMPLE_TIME
+        ),
+    }
+
+def explain(connection: Connection, stmt):
+    """Return the SQLite query plan of a statement as a list of detail strings"""
+    sql = stmt.compile(connection, compile_kwargs={"literal_binds": True})
+    return [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+def full_scans(connection: Connection):
+    """Return {query name: plan lines} for hot queries that scan a whole table"""
+    if connection.dialect.name != "sqlite":
+        return {}
+
+    problems = {}
+    for name, stmt in hot_queries().items():
+        plan = explain(connection, stmt)
+        scans = [
+            line for line in plan
+            if line.startswith("SCAN ") and " USING " not in line
+        ]
+        if scans:
+            problems[name] = plan
+    return problems
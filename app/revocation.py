@@ -0,0 +1,155 @@
+"""In-memory revocation list for access tokens.
+
+Access tokens are validated from their signed claims alone. A logout revokes
+one token id (jti), and a ban revokes every token issued to a collector up to
+that moment. Both are written to the token_revocations table. Each worker
+keeps the unexpired rows in memory and reloads them from a background thread
+every REVOCATION_SYNC_SECONDS, so a ban reaches every worker within that
+interval and no request pays for a query. A row is useless once every token it
+could match has expired. The list is therefore bounded by the access token
+lifetime and stays small enough for plain sets.
+
+Revocations reach the local list only once the transaction that wrote them
+commits, so a failed commit never leaves a revocation that sync() would
+later drop. Token iat claims are whole seconds, so bans are kept at whole
+seconds too, and a token issued in the second of a ban is revoked by it.
+"""
+import logging
+import math
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from . import models
+from .database import SessionLocal
+
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "2"))
+
+EPOCH = datetime(1970, 1, 1)
+
+logger = logging.getLogger("waste_app.revocation")
+
+
+def to_timestamp(moment: datetime) -> float:
+    """Seconds since the epoch for a naive UTC datetime"""
+    return (moment - EPOCH).total_seconds()
+
+def to_ban_second(moment: datetime) -> int:
+    """The whole second a ban covers tokens up to, matching the resolution of iat"""
+    return math.floor(to_timestamp(moment))
+
+
+class RevocationList:
+    def __init__(self, session_factory=SessionLocal, sync_interval: float = REVOCATION_SYNC_SECONDS):
+        self.session_factory = session_factory
+        self.sync_interval = sync_interval
+        self._jtis = {}  # jti -> expiry timestamp
+        self._collectors = {}  # collector id -> timestamp of the latest ban
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._jtis) + len(self._collectors)
+
+    def is_revoked(self, jti: str, collector_id: int, issued_at: float) -> bool:
+        """Whether an access token was logged out or issued before its owner was banned"""
+        if not self._loaded:
+            self.sync()
+            self.start()
+        if jti in self._jtis:
+            return True
+        banned_at = self._collectors.get(collector_id)
+        return banned_at is not None and math.floor(issued_at) <= banned_at
+
+    def revoke_token(self, db: Session, jti: str, expires_at: datetime):
+        """Revoke one access token as part of db's transaction"""
+        db.add(models.TokenRevocation(jti=jti, expires_at=expires_at))
+        self._prune_rows(db)
+
+        def apply():
+            self._jtis[jti] = to_timestamp(expires_at)
+        self._after_commit(db, apply)
+
+    def revoke_collector(self, db: Session, collector_id: int, expires_at: datetime):
+        """Revoke every access token issued to a collector so far, as part of db's transaction"""
+        revoked_at = datetime.utcnow()
+        db.add(models.TokenRevocation(collector_id=collector_id, revoked_at=revoked_at, expires_at=expires_at))
+        self._prune_rows(db)
+
+        def apply():
+            self._collectors[collector_id] = max(to_ban_second(revoked_at), self._collectors.get(collector_id, 0))
+        self._after_commit(db, apply)
+
+    def sync(self):
+        """Reload the unexpired revocations written by any worker"""
+        db = self.session_factory()
+        try:
+            rows = db.query(models.TokenRevocation).filter(
+                models.TokenRevocation.expires_at > datetime.utcnow()
+            ).all()
+        finally:
+            db.close()
+
+        jtis, collectors = {}, {}
+        for row in rows:
+            if row.jti is not None:
+                jtis[row.jti] = to_timestamp(row.expires_at)
+            if row.collector_id is not None:
+                collectors[row.collector_id] = max(
+                    to_ban_second(row.revoked_at), collectors.get(row.collector_id, 0)
+                )
+        with self._lock:
+            self._jtis = jtis
+            self._collectors = collectors
+            self._loaded = True
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="revocation-sync", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        thread = self._thread
+        if thread is not None:
+            self._stopping.set()
+            thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.sync_interval):
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Could not sync the token revocation list")
+
+    def _after_commit(self, db: Session, apply):
+        """Run apply() under the lock once db commits; forget it if db rolls back"""
+        pending = db.info.get(self)
+        if pending is None:
+            pending = db.info[self] = []
+
+            @event.listens_for(db, "after_commit")
+            def apply_pending(session):
+                with self._lock:
+                    for change in pending:
+                        change()
+                pending.clear()
+
+            @event.listens_for(db, "after_rollback")
+            def discard_pending(session):
+                pending.clear()
+        pending.append(apply)
+
+    def _prune_rows(self, db: Session):
+        db.query(models.TokenRevocation).filter(
+            models.TokenRevocation.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+
+
+revocations = RevocationList()
@@ -1,11 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, status, Body, File, Query, Response, UploadFile
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 from .. import models, schemas
-from ..database import get_db
-from ..auth import get_current_collector
+from ..catalog import catalog, bump_version
+from ..catalog_import import CatalogImportError, import_catalog, parse_catalog
+from ..database import get_async_db
+from ..auth import Principal, get_current_principal, invalidate_principal, revoke_collector_tokens
+from ..queries import list_collections_async, select_schema
+from ..responses import json_rows
+from ..pagination import decode_cursor, set_next_cursor
+from ..reconciliation import reconcile_ledgers, drifted_ledgers
+from ..exports import collections_export, transactions_export, export_response
 
 router = APIRouter(
     prefix="/admin",
@@ -13,8 +21,8 @@ router = APIRouter(
 )
 
 # --- Admin Dependency ---
-def get_current_admin(
-    user: models.Collector = Depends(get_current_collector)
+async def get_current_admin(
+    user: Principal = Depends(get_current_principal)
 ):
     if user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin privileges required")
@@ -22,88 +30,126 @@ def get_current_admin(
 
 # --- Dashboard ---
 @router.get("/dashboard", response_model=schemas.DashboardStats)
-def get_dashboard_stats(
-    db: Session = Depends(get_db),
-    current_admin: models.Collector = Depends(get_current_admin)
+async def get_dashboard_stats(
+    db: AsyncSession = Depends(get_async_db),
+    current_admin: Principal = Depends(get_current_admin)
 ):
     """Get overall system statistics"""
     # Total collectors
-    total_collectors = db.query(models.Collector).count()
-    active_collectors = db.query(models.Collector).filter(
+    total_collectors = await db.scalar(select(func.count(models.Collector.id)))
+    active_collectors = await db.scalar(select(func.count(models.Collector.id)).where(
         models.Collector.is_active == True
-    ).count()
+    ))
     
-    # Total collections
-    total_collections = db.query(models.Collection).count()
+    # Closed days come from the rollup table, today straight from collections
+    # through a range on the collected_at index
+    today = datetime.utcnow().date()
+    today_start = datetime.combine(today, datetime.min.time())
+    today_end = today_start + timedelta(days=1)
+    in_today = (
+        models.Collection.collected_at >= today_start,
+        models.Collection.collected_at < today_end
+    )
+    
+    past_stats = (await db.execute(select(
+        func.sum(models.DailyItemRollup.collection_count).label("count"),
+        func.sum(models.DailyItemRollup.total_weight_kg).label("total_weight"),
+        func.sum(models.DailyItemRollup.total_revenue).label("total_revenue")
+    ).where(
+        models.DailyItemRollup.day < today
+    ))).first()
     
-    # Total weight and revenue
-    collection_stats = db.query(
+    today_stats = (await db.execute(select(
+        func.count(models.Collection.id).label("count"),
         func.sum(models.Collection.weight_kg).label("total_weight"),
         func.sum(models.Collection.earned_amount).label("total_revenue")
-    ).first()
+    ).where(*in_today))).first()
     
-    # Collections today
-    today = datetime.utcnow().date()
-    collections_today = db.query(models.Collection).filter(
-        func.date(models.Collection.collected_at) == today
-    ).count()
+    # SUM() of an integer column comes back as Decimal on PostgreSQL
+    collections_today = today_stats.count
+    total_collections = int(past_stats.count or 0) + collections_today
+    total_weight = (past_stats.total_weight or 0) + (today_stats.total_weight or 0)
+    total_revenue = (past_stats.total_revenue or 0) + (today_stats.total_revenue or 0)
     
     # Top items by collection count
-    top_items = db.query(
-        models.RecyclableItem.name,
-        models.RecyclableItem.category,
-        func.count(models.Collection.id).label("collection_count"),
-        func.sum(models.Collection.weight_kg).label("total_weight")
-    ).join(
-        models.Collection, models.Collection.item_id == models.RecyclableItem.id
+    item_totals = {}
+    past_items = (await db.execute(select(
+        models.DailyItemRollup.item_id,
+        func.sum(models.DailyItemRollup.collection_count),
+        func.sum(models.DailyItemRollup.total_weight_kg)
+    ).where(
+        models.DailyItemRollup.day < today
     ).group_by(
-        models.RecyclableItem.id
-    ).order_by(
-        func.count(models.Collection.id).desc()
-    ).limit(5).all()
+        models.DailyItemRollup.item_id
+    ))).all()
+    today_items = (await db.execute(select(
+        models.Collection.item_id,
+        func.count(models.Collection.id),
+        func.sum(models.Collection.weight_kg)
+    ).where(*in_today).group_by(
+        models.Collection.item_id
+    ))).all()
+    for item_id, count, weight in past_items + today_items:
+        totals = item_totals.setdefault(item_id, [0, 0.0])
+        totals[0] += int(count or 0)
+        totals[1] += float(weight or 0)
+    
+    items_by_id = (await catalog.snapshot_async()).by_id
+    top_items = sorted(
+        (item_id for item_id in item_totals if item_id in items_by_id),
+        key=lambda item_id: (-item_totals[item_id][0], item_id)
+    )[:5]
     
     return {
         "total_collectors": total_collectors,
         "active_collectors": active_collectors,
         "total_collections": total_collections,
-        "total_weight_kg": float(collection_stats.total_weight or 0),
-        "total_revenue": float(collection_stats.total_revenue or 0),
+        "total_weight_kg": float(total_weight),
+        "total_revenue": float(total_revenue),
         "collections_today": collections_today,
         "top_items": [
             {
-                "name": item.name,
-                "category": item.category,
-                "collection_count": item.collection_count,
-                "total_weight_kg": float(item.total_weight or 0)
+                "name": items_by_id[item_id].name,
+                "category": items_by_id[item_id].category,
+                "collection_count": item_totals[item_id][0],
+                "total_weight_kg": float(item_totals[item_id][1])
             }
-            for item in top_items
+            for item_id in top_items
         ]
     }
 
 @router.get("/collectors", response_model=List[schemas.CollectorResponse])
-def get_all_users(
+async def get_all_users(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     role: Optional[str] = None,
-    db: Session = Depends(get_db),
-    current_admin: models.Collector = Depends(get_current_admin)
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    db: AsyncSession = Depends(get_async_db),
+    current_admin: Principal = Depends(get_current_admin)
 ):
     """Get all users (collectors, citizens, admins) with optional role filter"""
-    query = db.query(models.Collector)
+    stmt = select_schema(schemas.CollectorResponse, models.Collector).order_by(models.Collector.id)
     if role:
-        query = query.filter(models.Collector.role == role)
-    return query.offset(skip).limit(limit).all()
+        stmt = stmt.where(models.Collector.role == role)
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        stmt = stmt.where(models.Collector.id > last_id)
+    else:
+        stmt = stmt.offset(skip)
+    
+    users = [row._asdict() for row in await db.execute(stmt.limit(limit))]
+    set_next_cursor(response, users, limit, "id")
+    return json_rows(users, response)
 
 @router.get("/collectors/{user_id}", response_model=schemas.CollectorResponse)
-def get_user_by_id(
+async def get_user_by_id(
     user_id: int, 
-    db: Session = Depends(get_db),
-    current_admin: models.Collector = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_async_db),
+    current_admin: Principal = Depends(get_current_admin)
 ):
     """Get specific user by ID"""
-    user = db.query(models.Collector).filter(
-        models.Collector.id == user_id
-    ).first()
+    user = await db.get(models.Collector, user_id)
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -112,90 +158,132 @@ def get_user_by_id(
 
 # --- User Management Endpoints ---
 @router.put("/users/{user_id}", response_model=schemas.CollectorResponse)
-def update_user(
+async def update_user(
     user_id: int,
     user_update: schemas.CollectorBase,
-    db: Session = Depends(get_db),
-    current_admin: models.Collector = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_async_db),
+    current_admin: Principal = Depends(get_current_admin)
 ):
     """Admin update user details"""
-    user = db.query(models.Collector).filter(models.Collector.id == user_id).first()
+    user = await db.get(models.Collector, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    old_username = user.username
     user.username = user_update.username
     user.full_name = user_update.full_name
     user.phone_number = user_update.phone_number
     # Role update could be added here if schemas.CollectorBase had it, or use a specific schema
     
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    # After the commit, so a concurrent request cannot cache the old row again
+    invalidate_principal(old_username)
+    await db.refresh(user)
     return user
 
 @router.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(
+async def delete_user(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_admin: models.Collector = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_async_db),
+    current_admin: Principal = Depends(get_current_admin)
 ):
     """Delete user"""
-    user = db.query(models.Collector).filter(models.Collector.id == user_id).first()
+    user = await db.get(models.Collector, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Check for related records if needed, or rely on cascade
-    db.delete(user)
-    db.commit()
+    # Foreign keys are enforced, so users with a ledger history cannot be removed
+    has_history = await db.scalar(select(models.Collection.id).where(
+        models.Collection.collector_id == user_id
+    ).limit(1)) or await db.scalar(select(models.Transaction.id).where(
+        models.Transaction.collector_id == user_id
+    ).limit(1))
+    
+    if has_history:
+        raise HTTPException(
+            status_code=400,
+            detail="Cannot delete user with existing collections or transactions"
+        )
+    
+    await db.run_sync(revoke_collector_tokens, user.id)
+    await db.execute(delete(models.RefreshToken).where(
+        models.RefreshToken.collector_id == user_id
+    ))
+    await db.delete(user)
+    await db.commit()
+    invalidate_principal(user.username)
     return None
 
 @router.post("/users/{user_id}/toggle-active", response_model=schemas.CollectorResponse)
-def toggle_user_active(
+async def toggle_user_active(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_admin: models.Collector = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_async_db),
+    current_admin: Principal = Depends(get_current_admin)
 ):
     """Toggle user active status (Ban/Unban)"""
-    user = db.query(models.Collector).filter(models.Collector.id == user_id).first()
+    user = await db.get(models.Collector, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     user.is_active = not user.is_active
-    db.commit()
-    db.refresh(user)
+    if not user.is_active:
+        await db.run_sync(revoke_collector_tokens, user.id)
+    await db.commit()
+    invalidate_principal(user.username)
+    await db.refresh(user)
     return user
 
 @router.post("/items", response_model=schemas.RecyclableItemResponse, status_code=status.HTTP_201_CREATED)
-def create_recyclable_item(
+async def create_recyclable_item(
     item: schemas.RecyclableItemCreate,
-    db: Session = Depends(get_db),
-    current_admin: models.Collector = Depends(get_current_admin)
+    db: AsyncSession = Depends(get_async_db),
+    current_admin: Principal = Depends(get_current_admin)
 ):
     """Create a new recyclable item"""
     # Check if item already exists
-    existing_item = db.query(models.RecyclableItem).filter(
+    existing_item = await db.scalar(select(models.RecyclableItem.id).where(
         models.RecyclableItem.name == item.name
-    ).first()
+    ))
     
     if existing_item:
         raise HTTPException(status_code=400, detail="Item already exists")
     
     new_item = models.RecyclableItem(**item.dict())
     db.add(new_item)
-    db.commit()
-    db.refresh(new_item)
+    await db.run_sync(bump_version)
+    await db.commit()
+    catalog.invalidate()
+    await db.refresh(new_item)
     
     return new_item
 
+@router.post("/items/import", response_model=schemas.CatalogImportResult)
+async def import_recyclable_items(
+    file: UploadFile = File(..., description="CSV or JSON list of items keyed by name"),
+    format: Optional[str] = Query(None, pattern="^(csv|json)$", description="Defaults to the file extension"),
+    db: AsyncSession = Depends(get_async_db),
+    current_admin: Principal = Depends(get_current_admin)
+):
+    """Create or update many items at once; nothing is written unless every row is valid"""
+    if format is None and "." not in (file.filename or ""):
+        raise HTTPException(
+            status_code=422,
+            detail="Cannot tell the file format from its name; pass format=csv or format=json"
+        )
+    fmt = format or file.filename.rsplit(".", 1)[-1].lower()
+    try:
+        return await db.run_sync(import_catalog, parse_catalog(await file.read(), fmt))
+    except CatalogImportError as exc:
+        raise HTTPException(status_code=422, detail=exc.errors)
+
 @router.put("/items/{item_id}", response_model=schemas.RecyclableItemResponse)
-def update_recyclable_item(
+async def update_recyclable_item(
     item_id: int,
     item_update: schemas.RecyclableItemUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update a recyclable item"""
-    item = db.query(models.RecyclableItem).filter(
-        models.RecyclableItem.id == item_id
-    ).first()
+    item = await db.get(models.RecyclableItem, item_id)
     
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
@@ -205,25 +293,25 @@ def update_recyclable_item(
     for key, value in update_data.items():
         setattr(item, key, value)
     
-    db.commit()
-    db.refresh(item)
+    await db.run_sync(bump_version)
+    await db.commit()
+    catalog.invalidate()
+    await db.refresh(item)
     
     return item
 
 @router.delete("/items/{item_id}")
-def delete_recyclable_item(item_id: int, db: Session = Depends(get_db)):
+async def delete_recyclable_item(item_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a recyclable item"""
-    item = db.query(models.RecyclableItem).filter(
-        models.RecyclableItem.id == item_id
-    ).first()
+    item = await db.get(models.RecyclableItem, item_id)
     
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
     # Check if item has collections
-    has_collections = db.query(models.Collection).filter(
+    has_collections = await db.scalar(select(models.Collection.id).where(
         models.Collection.item_id == item_id
-    ).first()
+    ).limit(1))
     
     if has_collections:
         raise HTTPException(
@@ -231,38 +319,61 @@ def delete_recyclable_item(item_id: int, db: Session = Depends(get_db)):
             detail="Cannot delete item with existing collections"
         )
     
-    db.delete(item)
-    db.commit()
+    await db.delete(item)
+    await db.run_sync(bump_version)
+    await db.commit()
+    catalog.invalidate()
     
     return {"message": "Item deleted successfully"}
 
 @router.get("/collections/recent", response_model=List[schemas.CollectionResponse])
-def get_recent_collections(
+async def get_recent_collections(
     limit: int = 50,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get recent collections across all collectors"""
-    collections = db.query(models.Collection).order_by(
-        models.Collection.collected_at.desc()
-    ).limit(limit).all()
-    
-    result = []
-    for col in collections:
-        item = db.query(models.RecyclableItem).filter(
-            models.RecyclableItem.id == col.item_id
-        ).first()
-        
-        result.append({
-            "id": col.id,
-            "collector_id": col.collector_id,
-            "item_id": col.item_id,
-            "weight_kg": col.weight_kg,
-            "earned_amount": col.earned_amount,
-            "location": col.location,
-            "notes": col.notes,
-            "collected_at": col.collected_at,
-            "item_name": item.name if item else None,
-            "item_category": item.category if item else None
-        })
-    
-    return result
\ No newline at end of file
+    return json_rows(await list_collections_async(db, limit=limit))
+
+# --- Ledger Reconciliation ---
+@router.get("/ledger/drift", response_model=List[schemas.LedgerDrift])
+async def get_ledger_drift(
+    db: AsyncSession = Depends(get_async_db),
+    current_admin: Principal = Depends(get_current_admin)
+):
+    """Collectors whose balance disagreed with their transactions at the last reconciliation"""
+    return await db.run_sync(drifted_ledgers)
+
+@router.post("/ledger/reconcile", response_model=schemas.ReconciliationReport)
+async def run_ledger_reconciliation(
+    full: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_admin: Principal = Depends(get_current_admin)
+):
+    """Check the balances touched by transactions since the last run (or all history with full=true)"""
+    try:
+        return await db.run_sync(reconcile_ledgers, full)
+    except StaleDataError:
+        raise HTTPException(status_code=409, detail="Another reconciliation moved the checkpoints, try again")
+
+# --- Exports ---
+@router.get("/export/collections")
+async def export_collections(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start: Optional[datetime] = Query(None, description="Collected at or after (UTC)"),
+    end: Optional[datetime] = Query(None, description="Collected before (UTC)"),
+    collector_id: Optional[int] = None,
+    current_admin: Principal = Depends(get_current_admin)
+):
+    """Stream every matching collection as CSV or NDJSON"""
+    return export_response(collections_export(start, end, collector_id), format, "collections")
+
+@router.get("/export/transactions")
+async def export_transactions(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start: Optional[datetime] = Query(None, description="Created at or after (UTC)"),
+    end: Optional[datetime] = Query(None, description="Created before (UTC)"),
+    collector_id: Optional[int] = None,
+    current_admin: Principal = Depends(get_current_admin)
+):
+    """Stream every matching transaction as CSV or NDJSON"""
+    return export_response(transactions_export(start, end, collector_id), format, "transactions")
@@ -1,86 +1,89 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from fastapi import APIRouter, Query, Request, Response
 from typing import List, Optional
-from .. import models, schemas
-from ..database import get_db
+from .. import schemas
+from ..catalog import catalog, CATALOG_CACHE_CONTROL
+from ..query_log import query_log
+from ..responses import json_bytes, json_fragments, cache_headers, not_modified
 
 router = APIRouter(
     prefix="/citizen",
     tags=["Citizen"]
 )
 
+# These routes are served from the in-memory catalog, so they are async and
+# run on the event loop instead of taking a threadpool worker per request.
+# The periodic version check and any reload go to the threadpool through
+# catalog.snapshot_async(), so a slow database never blocks the loop.
+# Items go out as the JSON each snapshot encoded once when it was loaded, with
+# the snapshot's ETag, so revalidations are answered with 304.
+
 @router.get("/items", response_model=List[schemas.RecyclableItemResponse])
-def search_recyclable_items(
-    query: Optional[str] = Query(None, description="Search query for item name or category"),
+async def search_recyclable_items(
+    request: Request,
+    response: Response,
+    query: Optional[str] = Query(None, description="Search query for item name, category or instructions"),
     category: Optional[str] = Query(None, description="Filter by category"),
     skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    limit: int = 100
 ):
     """
     Search recyclable items by name or category.
     Citizens use this to find out if/how to recycle items.
+    Query terms match word prefixes and results are ranked by relevance.
     """
-    items_query = db.query(models.RecyclableItem)
+    snapshot = await catalog.snapshot_async()
+    items = snapshot.items
     
     # Apply filters
     if query:
-        search_filter = or_(
-            models.RecyclableItem.name.ilike(f"%{query}%"),
-            models.RecyclableItem.category.ilike(f"%{query}%"),
-            models.RecyclableItem.instructions.ilike(f"%{query}%")
-        )
-        items_query = items_query.filter(search_filter)
+        items, total_results = snapshot.search_index.search(query)
         
-        # Log the query
-        citizen_query = models.CitizenQuery(
-            query_text=query,
-            result_count=items_query.count()
-        )
-        db.add(citizen_query)
-        db.commit()
+        # Log the query (written in batches by a background thread)
+        query_log.record(query, total_results)
     
     if category:
-        items_query = items_query.filter(models.RecyclableItem.category == category)
+        items = [item for item in items if item.category == category]
     
-    items = items_query.offset(skip).limit(limit).all()
-    return items
+    cache_headers(response, snapshot.etag, CATALOG_CACHE_CONTROL)
+    return not_modified(request, response) or json_fragments(
+        [snapshot.encoded[item.id] for item in items[skip:skip + limit]], response
+    )
 
 @router.get("/items/{item_id}", response_model=schemas.RecyclableItemResponse)
-def get_recyclable_item(item_id: int, db: Session = Depends(get_db)):
+async def get_recyclable_item(item_id: int, request: Request, response: Response):
     """Get details of a specific recyclable item"""
-    item = db.query(models.RecyclableItem).filter(
-        models.RecyclableItem.id == item_id
-    ).first()
+    snapshot = await catalog.snapshot_async()
+    item = snapshot.encoded.get(item_id)
     
     if not item:
         from fastapi import HTTPException
         raise HTTPException(status_code=404, detail="Item not found")
     
-    return item
+    cache_headers(response, snapshot.etag, CATALOG_CACHE_CONTROL)
+    return not_modified(request, response) or json_bytes(item, response)
 
 @router.get("/categories")
-def get_categories(db: Session = Depends(get_db)):
+async def get_categories(request: Request, response: Response):
     """Get all available categories"""
-    categories = db.query(models.RecyclableItem.category).distinct().all()
-    return {"categories": [cat[0] for cat in categories]}
+    snapshot = await catalog.snapshot_async()
+    cache_headers(response, snapshot.etag, CATALOG_CACHE_CONTROL)
+    return not_modified(request, response) or {"categories": snapshot.categories}
 
 @router.get("/instructions/{item_name}")
-def get_recycling_instructions(item_name: str, db: Session = Depends(get_db)):
+async def get_recycling_instructions(item_name: str):
     """Get recycling instructions for a specific item by name"""
-    item = db.query(models.RecyclableItem).filter(
-        models.RecyclableItem.name.ilike(f"%{item_name}%")
-    ).first()
+    snapshot = await catalog.snapshot_async()
+    needle = item_name.lower()
+    item = snapshot.by_name.get(needle) or next(
+        (item for item in snapshot.items if needle in item.name.lower()), None
+    )
     
     if not item:
         # Try to find similar items
-        similar_items = db.query(models.RecyclableItem).filter(
-            or_(
-                models.RecyclableItem.name.ilike(f"%{item_name}%"),
-                models.RecyclableItem.category.ilike(f"%{item_name}%")
-            )
-        ).limit(5).all()
+        similar_items = [
+            item for item in snapshot.items
+            if needle in item.name.lower() or needle in item.category.lower()
+        ][:5]
         
         if not similar_items:
             from fastapi import HTTPException
@@ -1,38 +1,64 @@
-from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Form, Header, Query, Response
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
 import shutil
 import os
 import uuid
 from datetime import datetime, timedelta
 from .. import models, schemas
-from ..database import get_db
-from ..auth import get_current_collector, get_password_hash
+from ..database import get_async_db
+from ..auth import (
+    Principal, get_current_principal, get_current_collector, get_password_hash,
+    issue_tokens, rotate_refresh_token, revoke_access_token, hash_refresh_token
+)
+from ..queries import list_collections_async, select_schema
+from ..responses import json_rows
+from ..ledger import record_collections, debit_balance
+from ..idempotency import idempotency, IDEMPOTENCY_KEY_HEADER
+from ..pagination import decode_cursor, seek_descending, set_next_cursor
 
 router = APIRouter(
     prefix="/collectors",
     tags=["Collectors"]
 )
 
+# Routes are async and query through an AsyncSession. Writes reuse the sync
+# ledger and token helpers through AsyncSession.run_sync; bcrypt and file
+# uploads wait on the threadpool.
+
+def save_profile_image(file: UploadFile) -> str:
+    """Write an uploaded profile image under static/images, returns its URL"""
+    static_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "static", "images")
+    if not os.path.exists(static_dir):
+        os.makedirs(static_dir)
+    
+    file_extension = file.filename.split(".")[-1]
+    filename = f"{uuid.uuid4()}.{file_extension}"
+    file_path = os.path.join(static_dir, filename)
+    
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+    
+    return f"/static/images/{filename}"
+
 # ----------------- Register -----------------
 @router.post("/register", response_model=schemas.CollectorResponse, status_code=status.HTTP_201_CREATED)
-def register_collector(
+async def register_collector(
     username: str = Form(...),
     full_name: str = Form(...),
     phone_number: str = Form(...),
     password: str = Form(...),
     role: str = Form("collector"),
     file: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Register a new user (Collector, Citizen, etc.) with optional profile image"""
-    from ..auth import get_password_hash
-
     # Check if username exists
-    db_collector = db.query(models.Collector).filter(
+    db_collector = await db.scalar(select(models.Collector.id).where(
         models.Collector.username == username
-    ).first()
+    ))
     
     if db_collector:
         raise HTTPException(status_code=400, detail="Username already registered")
@@ -40,23 +66,10 @@ def register_collector(
     # Handle Image Upload
     image_url = None
     if file:
-        # Create static/images directory if not exists
-        static_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "static", "images")
-        if not os.path.exists(static_dir):
-            os.makedirs(static_dir)
-        
-        # Save file
-        file_extension = file.filename.split(".")[-1]
-        filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = os.path.join(static_dir, filename)
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        image_url = f"/static/images/{filename}"
+        image_url = await run_in_threadpool(save_profile_image, file)
 
     # Create new collector
-    hashed_password = get_password_hash(password)
+    hashed_password = await run_in_threadpool(get_password_hash, password)
     new_collector = models.Collector(
         username=username,
         full_name=full_name,
@@ -67,18 +80,18 @@ def register_collector(
     )
     
     db.add(new_collector)
-    db.commit()
-    db.refresh(new_collector)
+    await db.commit()
+    await db.refresh(new_collector)
     
     return new_collector
 
 # ----------------- Login -----------------
 @router.post("/login")
-def login_collector(credentials: schemas.CollectorLogin, db: Session = Depends(get_db)):
+async def login_collector(credentials: schemas.CollectorLogin, db: AsyncSession = Depends(get_async_db)):
     """Login collector and return JWT token"""
-    from ..auth import authenticate_collector, create_access_token  # lazy import
+    from ..auth import authenticate_collector  # lazy import
 
-    collector = authenticate_collector(db, credentials.username, credentials.password)
+    collector = await authenticate_collector(db, credentials.username, credentials.password)
     
     if not collector:
         raise HTTPException(
@@ -87,11 +100,11 @@ def login_collector(credentials: schemas.CollectorLogin, db: Session = Depends(g
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token = create_access_token(data={"sub": collector.username})
+    tokens = await db.run_sync(issue_tokens, collector)
+    await db.commit()
     
     return {
-        "access_token": access_token,
-        "token_type": "bearer",
+        **tokens,
         "collector": {
             "id": collector.id,
             "username": collector.username,
@@ -102,22 +115,47 @@ def login_collector(credentials: schemas.CollectorLogin, db: Session = Depends(g
         }
     }
 
+# ----------------- Refresh & Logout -----------------
+@router.post("/refresh")
+async def refresh_tokens(request: schemas.RefreshTokenRequest, db: AsyncSession = Depends(get_async_db)):
+    """Exchange a refresh token for a new access token and refresh token"""
+    collector = await db.run_sync(rotate_refresh_token, request.refresh_token)
+    tokens = await db.run_sync(issue_tokens, collector)
+    await db.commit()
+    return tokens
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    request: Optional[schemas.LogoutRequest] = None,
+    current_collector: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Revoke the current access token and, when given, its refresh token"""
+    await db.run_sync(revoke_access_token, current_collector)
+    if request and request.refresh_token:
+        await db.execute(update(models.RefreshToken).where(
+            models.RefreshToken.token_hash == hash_refresh_token(request.refresh_token),
+            models.RefreshToken.collector_id == current_collector.id
+        ).values(revoked_at=datetime.utcnow()))
+    await db.commit()
+    return None
+
 # ----------------- Current Collector Info & Profile Update -----------------
 @router.get("/me", response_model=schemas.CollectorResponse)
-def get_current_collector_info(
+async def get_current_collector_info(
     current_collector: models.Collector = Depends(get_current_collector)
 ):
     """Get current user information"""
     return current_collector
 
 @router.put("/me", response_model=schemas.CollectorResponse)
-def update_profile(
+async def update_profile(
     full_name: Optional[str] = Form(None),
     phone_number: Optional[str] = Form(None),
     password: Optional[str] = Form(None),
     file: Optional[UploadFile] = File(None),
     current_collector: models.Collector = Depends(get_current_collector),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update current user profile"""
 
@@ -126,209 +164,162 @@ def update_profile(
     if phone_number:
         current_collector.phone_number = phone_number
     if password:
-        current_collector.hashed_password = get_password_hash(password)
+        current_collector.hashed_password = await run_in_threadpool(get_password_hash, password)
     
     if file:
-        static_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "static", "images")
-        if not os.path.exists(static_dir):
-            os.makedirs(static_dir)
-            
-        file_extension = file.filename.split(".")[-1]
-        filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = os.path.join(static_dir, filename)
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        current_collector.profile_image = f"/static/images/{filename}"
+        current_collector.profile_image = await run_in_threadpool(save_profile_image, file)
     
-    db.commit()
-    db.refresh(current_collector)
+    await db.commit()
+    await db.refresh(current_collector)
     return current_collector
 
 # ----------------- Collector Stats -----------------
 @router.get("/me/stats", response_model=schemas.CollectorStats)
-def get_collector_stats(
+async def get_collector_stats(
     current_collector: models.Collector = Depends(get_current_collector),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get collector statistics"""
-    # Total collections
-    total_collections = db.query(models.Collection).filter(
-        models.Collection.collector_id == current_collector.id
-    ).count()
-    
-    # Total weight and earnings
-    stats = db.query(
-        func.sum(models.Collection.weight_kg).label("total_weight"),
-        func.sum(models.Collection.earned_amount).label("total_earned")
-    ).filter(
-        models.Collection.collector_id == current_collector.id
-    ).first()
-    
-    # Collections by category
-    category_stats = db.query(
-        models.RecyclableItem.category,
-        func.count(models.Collection.id).label("count"),
-        func.sum(models.Collection.weight_kg).label("weight")
-    ).join(
-        models.Collection, models.Collection.item_id == models.RecyclableItem.id
-    ).filter(
-        models.Collection.collector_id == current_collector.id
-    ).group_by(
-        models.RecyclableItem.category
-    ).all()
+    # Per-category totals are maintained by create_collection
+    category_stats = (await db.scalars(select(models.CollectorCategoryStats).where(
+        models.CollectorCategoryStats.collector_id == current_collector.id
+    ))).all()
     
     collections_by_category = {
         cat.category: {
-            "count": cat.count,
-            "weight_kg": float(cat.weight or 0)
+            "count": cat.collection_count,
+            "weight_kg": float(cat.total_weight_kg or 0)
         }
         for cat in category_stats
     }
     
     return {
-        "total_collections": total_collections,
-        "total_weight_kg": float(stats.total_weight or 0),
-        "total_earned": float(stats.total_earned or 0),
+        "total_collections": sum(cat.collection_count for cat in category_stats),
+        "total_weight_kg": float(sum(cat.total_weight_kg for cat in category_stats)),
+        "total_earned": float(sum(cat.total_earned for cat in category_stats)),
         "balance": current_collector.balance,
         "collections_by_category": collections_by_category
     }
 
 # ----------------- Create Collection -----------------
 @router.post("/collections", response_model=schemas.CollectionResponse, status_code=status.HTTP_201_CREATED)
-def create_collection(
+async def create_collection(
     collection: schemas.CollectionCreate,
-    current_collector: models.Collector = Depends(get_current_collector),
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_KEY_HEADER, max_length=255),
+    current_collector: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Record a new collection"""
-    # Verify item exists
-    item = db.query(models.RecyclableItem).filter(
-        models.RecyclableItem.id == collection.item_id
-    ).first()
+    def execute(session):
+        (result,) = record_collections(session, current_collector.id, [collection])
+        if isinstance(result, str):
+            raise HTTPException(status_code=404, detail=result)
+        return result
     
-    if not item:
-        raise HTTPException(status_code=404, detail="Recyclable item not found")
-    
-    # Calculate earnings
-    earned_amount = collection.weight_kg * item.price_per_kg
-    
-    # Create collection record
-    new_collection = models.Collection(
-        collector_id=current_collector.id,
-        item_id=collection.item_id,
-        weight_kg=collection.weight_kg,
-        earned_amount=earned_amount,
-        location=collection.location,
-        notes=collection.notes
+    return await idempotency.run(
+        db, current_collector.id, idempotency_key, "POST /collectors/collections", collection,
+        execute, schemas.CollectionResponse, status_code=status.HTTP_201_CREATED
     )
+
+@router.post("/collections/batch", response_model=schemas.CollectionBatchResponse)
+async def create_collections_batch(
+    batch: schemas.CollectionBatchCreate,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_KEY_HEADER, max_length=255),
+    current_collector: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Record several collections at once; entries that fail do not block the rest"""
+    def execute(session):
+        results = record_collections(session, current_collector.id, batch.entries)
+        failed = sum(isinstance(result, str) for result in results)
+        return {
+            "created": len(results) - failed,
+            "failed": failed,
+            "results": [
+                {"index": index, "status": "failed", "detail": result}
+                if isinstance(result, str) else
+                {"index": index, "status": "created", "collection": result}
+                for index, result in enumerate(results)
+            ]
+        }
     
-    # Update collector stats
-    current_collector.balance += earned_amount
-    current_collector.total_collected_kg += collection.weight_kg
-    
-    # Create transaction record
-    transaction = models.Transaction(
-        collector_id=current_collector.id,
-        transaction_type="collection",
-        amount=earned_amount,
-        description=f"Collected {collection.weight_kg}kg of {item.name}"
+    return await idempotency.run(
+        db, current_collector.id, idempotency_key, "POST /collectors/collections/batch", batch,
+        execute, schemas.CollectionBatchResponse
     )
-    
-    db.add(new_collection)
-    db.add(transaction)
-    db.commit()
-    db.refresh(new_collection)
-    
-    return {
-        **collection.dict(),
-        "id": new_collection.id,
-        "collector_id": current_collector.id,
-        "earned_amount": earned_amount,
-        "collected_at": new_collection.collected_at,
-        "item_name": item.name,
-        "item_category": item.category
-    }
 
 # ----------------- Get Collections -----------------
 @router.get("/collections", response_model=List[schemas.CollectionResponse])
-def get_my_collections(
+async def get_my_collections(
+    response: Response,
     skip: int = 0,
     limit: int = 50,
-    current_collector: models.Collector = Depends(get_current_collector),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    current_collector: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get collector's collection history"""
-    collections = db.query(models.Collection).filter(
-        models.Collection.collector_id == current_collector.id
-    ).order_by(
-        models.Collection.collected_at.desc()
-    ).offset(skip).limit(limit).all()
-    
-    # Add item details
-    result = []
-    for col in collections:
-        item = db.query(models.RecyclableItem).filter(
-            models.RecyclableItem.id == col.item_id
-        ).first()
-        
-        result.append({
-            "id": col.id,
-            "collector_id": col.collector_id,
-            "item_id": col.item_id,
-            "weight_kg": col.weight_kg,
-            "earned_amount": col.earned_amount,
-            "location": col.location,
-            "notes": col.notes,
-            "collected_at": col.collected_at,
-            "item_name": item.name if item else None,
-            "item_category": item.category if item else None
-        })
-    
-    return result
+    after = decode_cursor(cursor, datetime, int) if cursor else None
+    collections = await list_collections_async(
+        db, collector_id=current_collector.id, skip=skip, limit=limit, after=after
+    )
+    set_next_cursor(response, collections, limit, "collected_at", "id")
+    return json_rows(collections, response)
 
 # ----------------- Withdraw -----------------
 @router.post("/withdraw", response_model=schemas.TransactionResponse)
-def withdraw_balance(
+async def withdraw_balance(
     withdrawal: schemas.TransactionCreate,
-    current_collector: models.Collector = Depends(get_current_collector),
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_KEY_HEADER, max_length=255),
+    current_collector: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Withdraw balance"""
-    if withdrawal.amount > current_collector.balance:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-    
-    # Update balance
-    current_collector.balance -= withdrawal.amount
+    def execute(session):
+        # Checked and applied in one conditional UPDATE
+        if not debit_balance(session, current_collector.id, withdrawal.amount):
+            raise HTTPException(status_code=400, detail="Insufficient balance")
+        
+        # Create transaction
+        transaction = models.Transaction(
+            collector_id=current_collector.id,
+            transaction_type="withdrawal",
+            amount=-withdrawal.amount,
+            description=withdrawal.description or "Balance withdrawal"
+        )
+        session.add(transaction)
+        return transaction
     
-    # Create transaction
-    transaction = models.Transaction(
-        collector_id=current_collector.id,
-        transaction_type="withdrawal",
-        amount=-withdrawal.amount,
-        description=withdrawal.description or "Balance withdrawal"
+    return await idempotency.run(
+        db, current_collector.id, idempotency_key, "POST /collectors/withdraw", withdrawal,
+        execute, schemas.TransactionResponse
     )
-    
-    db.add(transaction)
-    db.commit()
-    db.refresh(transaction)
-    
-    return transaction
 
 # ----------------- Transactions -----------------
 @router.get("/transactions", response_model=List[schemas.TransactionResponse])
-def get_transactions(
+async def get_transactions(
+    response: Response,
     skip: int = 0,
     limit: int = 50,
-    current_collector: models.Collector = Depends(get_current_collector),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    current_collector: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get transaction history"""
-    transactions = db.query(models.Transaction).filter(
+    stmt = select_schema(schemas.TransactionResponse, models.Transaction).where(
         models.Transaction.collector_id == current_collector.id
     ).order_by(
-        models.Transaction.created_at.desc()
-    ).offset(skip).limit(limit).all()
+        models.Transaction.created_at.desc(),
+        models.Transaction.id.desc()
+    )
+    if cursor:
+        stmt = stmt.where(seek_descending(
+            models.Transaction.created_at, models.Transaction.id, *decode_cursor(cursor, datetime, int)
+        ))
+    else:
+        stmt = stmt.offset(skip)
+    
+    transactions = [row._asdict() for row in await db.execute(stmt.limit(limit))]
     
-    return transactions
+    set_next_cursor(response, transactions, limit, "created_at", "id")
+    return json_rows(transactions, response)
@@ -15,6 +15,12 @@ class CollectorLogin(BaseModel):
     username: str
     password: str
 
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
 class CollectorResponse(CollectorBase):
     id: int
     balance: float
@@ -57,6 +63,11 @@ class RecyclableItemResponse(RecyclableItemBase):
     class Config:
         from_attributes = True
 
+class CatalogImportResult(BaseModel):
+    created: int
+    updated: int
+    unchanged: int
+
 # --- Collection Schemas ---
 class CollectionBase(BaseModel):
     item_id: int
@@ -78,6 +89,20 @@ class CollectionResponse(CollectionBase):
     class Config:
         from_attributes = True
 
+class CollectionBatchCreate(BaseModel):
+    entries: List[CollectionCreate] = Field(..., min_length=1, max_length=500)
+
+class CollectionBatchResult(BaseModel):
+    index: int
+    status: str  # "created" or "failed"
+    collection: Optional[CollectionResponse] = None
+    detail: Optional[str] = None
+
+class CollectionBatchResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[CollectionBatchResult]
+
 # --- Transaction Schemas ---
 class TransactionBase(BaseModel):
     transaction_type: str
@@ -113,4 +138,20 @@ class DashboardStats(BaseModel):
     total_weight_kg: float
     total_revenue: float
     collections_today: int
-    top_items: List[dict]
\ No newline at end of file
+    top_items: List[dict]
+
+# --- Ledger Reconciliation Schemas ---
+class LedgerDrift(BaseModel):
+    collector_id: int
+    balance: float
+    ledger_sum: float
+    drift: float
+    checked_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class ReconciliationReport(BaseModel):
+    transactions_checked: int
+    collectors_checked: int
+    drifted: List[LedgerDrift]
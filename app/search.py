@@ -0,0 +1,79 @@
+"""Inverted index used for citizen item search.
+
+The index is built once per catalog snapshot. Every query term must match
+the start of a word in the item name, category or instructions. Results are
+ranked by field weight and term rarity, and the total is counted in the same
+pass.
+"""
+import bisect
+import math
+import re
+from collections import defaultdict
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Matches in the name count more than matches in the category or instructions
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "instructions": 1.0}
+
+# Score multiplier for a term that only matches a longer word
+PREFIX_MATCH_BOOST = 0.5
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+class SearchIndex:
+    def __init__(self, items: list):
+        self.items = items
+        postings = defaultdict(dict)  # token -> {item position: field weight}
+        for position, item in enumerate(items):
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in set(tokenize(getattr(item, field))):
+                    postings[token][position] = postings[token].get(position, 0.0) + weight
+        self.postings = dict(postings)
+        self.tokens = sorted(self.postings)
+        self.idf = {
+            token: math.log(1 + len(items) / len(matches))
+            for token, matches in self.postings.items()
+        }
+
+    def _expand(self, term):
+        """Yield every indexed token that starts with term"""
+        start = bisect.bisect_left(self.tokens, term)
+        for token in self.tokens[start:]:
+            if not token.startswith(term):
+                break
+            yield token
+
+    def search(self, query: str):
+        """Return (ranked items, total matches) for a free-text query"""
+        terms = tokenize(query)
+        if not terms:
+            return [], 0
+
+        scores = None
+        for term in terms:
+            term_scores = {}
+            for token in self._expand(term):
+                boost = 1.0 if token == term else PREFIX_MATCH_BOOST
+                idf = self.idf[token]
+                for position, weight in self.postings[token].items():
+                    score = weight * idf * boost
+                    if score > term_scores.get(position, 0.0):
+                        term_scores[position] = score
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    position: score + term_scores[position]
+                    for position, score in scores.items()
+                    if position in term_scores
+                }
+            if not scores:
+                return [], 0
+
+        ranked = sorted(scores, key=lambda position: (-scores[position], position))
+        return [self.items[position] for position in ranked], len(ranked)
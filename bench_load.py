@@ -0,0 +1,111 @@
+"""Load test: sustained concurrency and p99 latency of a running API process.
+
+Starts uvicorn on a throwaway SQLite database (or on --database-url), registers a collector, then
+keeps N concurrent clients busy for a fixed time. Each client sends a mix of
+public catalog searches and authenticated collection listings. Every
+concurrency level is run twice: once with Starlette's stock 40-thread pool,
+and once with THREADPOOL_SIZE left at its configured default. Both route
+kinds are async, so the two runs should match; a gap means some request
+path still holds a worker thread while it waits.
+
+Usage: python bench_load.py [--levels 40,100,200] [--seconds 10] [--port 8765] [--database-url URL]
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+
+def start_server(port, database_url, threadpool_size):
+    env = {**os.environ, "DATABASE_URL": database_url}
+    if threadpool_size:
+        env["THREADPOOL_SIZE"] = str(threadpool_size)
+    else:
+        env.pop("THREADPOOL_SIZE", None)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/health", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("API did not start")
+
+def login(base_url):
+    form = {"username": "loadtest", "full_name": "Load Test", "phone_number": "12345678", "password": "loadtest"}
+    httpx.post(f"{base_url}/collectors/register", data=form)
+    response = httpx.post(f"{base_url}/collectors/login", json={"username": "loadtest", "password": "loadtest"})
+    token = response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(50):
+        httpx.post(f"{base_url}/collectors/collections", json={"item_id": 1, "weight_kg": 1.5}, headers=headers)
+    return headers
+
+async def client(http, headers, deadline, latencies, failures):
+    rng = random.Random()
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            if rng.random() < 0.7:
+                response = await http.get("/citizen/items", params={"query": rng.choice(["can", "paper", "glass"])})
+            else:
+                response = await http.get("/collectors/collections", headers=headers)
+            if response.status_code != 200:
+                failures.append(response.status_code)
+        except httpx.HTTPError:
+            failures.append(None)
+        latencies.append(time.perf_counter() - started)
+
+async def run_level(base_url, headers, concurrency, seconds):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as http:
+        latencies, failures = [], []
+        deadline = time.monotonic() + seconds
+        await asyncio.gather(*(
+            client(http, headers, deadline, latencies, failures) for _ in range(concurrency)
+        ))
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    return len(latencies) / seconds, p50, p99, len(failures)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--levels", default="40,100,200")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--database-url", help="Run against this database instead of a throwaway SQLite file")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(",")]
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    print(f"{'threadpool':>12} {'clients':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for label, threadpool_size in (("stock 40", 40), ("configured", None)):
+        with tempfile.TemporaryDirectory() as directory:
+            database_url = args.database_url or f"sqlite:///{os.path.join(directory, 'load.db')}"
+            server = start_server(args.port, database_url, threadpool_size)
+            try:
+                headers = login(base_url)
+                for concurrency in levels:
+                    throughput, p50, p99, errors = asyncio.run(
+                        run_level(base_url, headers, concurrency, args.seconds)
+                    )
+                    print(f"{label:>12} {concurrency:>8} {throughput:>8.0f} {p50:>8.1f} {p99:>8.1f} {errors:>7}")
+            finally:
+                server.terminate()
+                server.wait()
+
+if __name__ == "__main__":
+    main()
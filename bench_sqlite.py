@@ -0,0 +1,106 @@
+"""Mixed read/write throughput of the default SQLite settings vs. the tuned
+profile in app/database.py.
+
+Usage: python bench_sqlite.py [--threads 16] [--seconds 5] [--write-ratio 0.2]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.database import Base, create_database_engine
+from app.queries import list_collections
+
+
+def make_engine(path, tuned):
+    if tuned:
+        engine = create_database_engine(f"sqlite:///{path}")
+    else:
+        # The settings app/database.py used before the profile existed
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+def seed(session_factory, collectors=20, rows_per_collector=500):
+    db = session_factory()
+    item = models.RecyclableItem(name="Aluminum Can", category="Metal", price_per_kg=3.5)
+    db.add(item)
+    for index in range(collectors):
+        db.add(models.Collector(
+            username=f"collector{index}", full_name="Bench", phone_number="12345678", hashed_password="x"
+        ))
+    db.flush()
+    db.add_all([
+        models.Collection(collector_id=index + 1, item_id=item.id, weight_kg=1.0, earned_amount=3.5)
+        for index in range(collectors)
+        for _ in range(rows_per_collector)
+    ])
+    db.commit()
+    db.close()
+
+def worker(session_factory, deadline, write_ratio, counts, errors):
+    rng = random.Random()
+    reads = writes = 0
+    while time.monotonic() < deadline:
+        collector_id = rng.randint(1, 20)
+        db = session_factory()
+        try:
+            if rng.random() < write_ratio:
+                db.add(models.Collection(collector_id=collector_id, item_id=1, weight_kg=1.0, earned_amount=3.5))
+                db.add(models.Transaction(collector_id=collector_id, transaction_type="collection", amount=3.5))
+                db.commit()
+                writes += 1
+            else:
+                list_collections(db, collector_id=collector_id, limit=50)
+                reads += 1
+        except Exception:
+            db.rollback()
+            errors.append(1)
+        finally:
+            db.close()
+    counts.append((reads, writes))
+
+def run(tuned, threads, seconds, write_ratio):
+    # Use the project disk rather than a possibly memory-backed /tmp so fsync costs are real
+    with tempfile.TemporaryDirectory(dir=".") as directory:
+        engine = make_engine(os.path.join(directory, "bench.db"), tuned)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        seed(session_factory)
+
+        counts, errors = [], []
+        deadline = time.monotonic() + seconds
+        pool = [
+            threading.Thread(target=worker, args=(session_factory, deadline, write_ratio, counts, errors))
+            for _ in range(threads)
+        ]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        engine.dispose()
+
+    reads = sum(r for r, _ in counts)
+    writes = sum(w for _, w in counts)
+    label = "tuned  " if tuned else "default"
+    print(
+        f"{label}: {reads / seconds:8.0f} reads/s  {writes / seconds:7.0f} writes/s  "
+        f"{len(errors)} errors"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"{args.threads} threads, {args.seconds}s, {args.write_ratio:.0%} writes")
+    run(False, args.threads, args.seconds, args.write_ratio)
+    run(True, args.threads, args.seconds, args.write_ratio)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import asyncio
+import os
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+# Fail any request that runs the same statement over and over (see app/database.py)
+os.environ.setdefault("N_PLUS_ONE_MODE", "raise")
+
+from app import models
+from app.database import Base, create_async_database_engine, create_database_engine
+
+
+@pytest.fixture(scope="session")
+def postgres_url(tmp_path_factory):
+    """URL of a PostgreSQL database for the postgresql test runs.
+
+    Uses TEST_POSTGRES_URL when set, otherwise starts a throwaway local server
+    with the pgserver package. Without either, PostgreSQL runs are skipped.
+    """
+    url = os.getenv("TEST_POSTGRES_URL")
+    if url:
+        yield url
+        return
+    try:
+        import pgserver
+    except ImportError:
+        pytest.skip("set TEST_POSTGRES_URL or install pgserver to run PostgreSQL tests")
+    server = pgserver.get_server(tmp_path_factory.mktemp("pgdata"), cleanup_mode="stop")
+    yield server.get_uri()
+    server.cleanup()
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def engine(request, tmp_path):
+    """A throwaway database with the full schema, on each supported backend"""
+    if request.param == "sqlite":
+        test_engine = create_database_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    else:
+        test_engine = create_database_engine(request.getfixturevalue("postgres_url"))
+        Base.metadata.drop_all(bind=test_engine)
+    Base.metadata.create_all(bind=test_engine)
+    yield test_engine
+    test_engine.dispose()
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@pytest.fixture
+def async_engine(engine):
+    """The test database through the async driver the routes use.
+
+    Connections are not pooled, since each asyncio.run() or test client
+    request may bring its own event loop.
+    """
+    test_engine = create_async_database_engine(engine.url.render_as_string(hide_password=False), pooled=False)
+
+    # Connect once here, so tests that run several loops at once don't race
+    # through the engine's first-connect setup, which is guarded by an asyncio lock
+    async def first_connect():
+        async with test_engine.connect():
+            pass
+    asyncio.run(first_connect())
+    yield test_engine
+    test_engine.sync_engine.dispose()
+
+@pytest.fixture
+def async_session_factory(async_engine):
+    return async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+@pytest.fixture
+def collector(db):
+    """A plain collector account, committed"""
+    collector = models.Collector(
+        username="ali", full_name="Ali Tounsi", phone_number="12345678", hashed_password="x"
+    )
+    db.add(collector)
+    db.commit()
+    return collector
+
+@pytest.fixture
+def count_statements(engine):
+    """Context manager collecting the SQL statements an engine (the sync one by default) runs inside it"""
+    @contextmanager
+    def counting(target=engine):
+        statements = []
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(target, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(target, "before_cursor_execute", before_cursor_execute)
+    return counting
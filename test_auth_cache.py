@@ -0,0 +1,48 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from app.auth import create_access_token, get_current_principal, invalidate_principal, principal_cache
+from app.cache import TTLCache
+
+
+def test_principal_is_cached_until_invalidated(db, collector, async_engine, async_session_factory, count_statements):
+    credentials = HTTPAuthorizationCredentials(
+        scheme="Bearer", credentials=create_access_token(data={"sub": "ali"})
+    )
+    principal_cache.clear()
+
+    async def principal():
+        async with async_session_factory() as session:
+            return await get_current_principal(credentials, session)
+
+    with count_statements(async_engine.sync_engine) as statements:
+        first = asyncio.run(principal())
+        second = asyncio.run(principal())
+    assert first == second
+    assert (first.id, first.role, first.is_active) == (collector.id, "collector", True)
+    assert len(statements) == 1
+
+    collector.is_active = False
+    db.commit()
+    assert asyncio.run(principal()).is_active
+    invalidate_principal("ali")
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(principal())
+    assert exc_info.value.status_code == 400
+    principal_cache.clear()
+
+def test_ttl_cache_expires_and_evicts_least_recently_used():
+    now = [0.0]
+    cache = TTLCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+    now[0] = 10
+    assert cache.get("a") is None
+    assert cache.get("c") is None
+    assert len(cache) == 0
@@ -0,0 +1,57 @@
+import asyncio
+import threading
+import time
+from app import catalog_import
+from app.catalog import CatalogCache, bump_version, get_version
+from app.catalog_import import import_catalog
+
+
+def test_concurrent_first_bumps_both_count(session_factory):
+    first, second = session_factory(), session_factory()
+    bump_version(first)  # Holds the new row until it commits
+
+    def bump():
+        bump_version(second)
+        second.commit()
+    thread = threading.Thread(target=bump)
+    thread.start()
+    time.sleep(0.2)
+    first.commit()
+    thread.join()
+    first.close()
+    second.close()
+
+    with session_factory() as db:
+        assert get_version(db) == 2
+
+def test_catalog_write_invalidates_the_snapshot(session_factory, db, monkeypatch):
+    # A check interval this long means only the invalidation can refresh the snapshot
+    local = CatalogCache(session_factory, check_interval=3600)
+    other_worker = CatalogCache(session_factory, check_interval=0)
+    monkeypatch.setattr(catalog_import, "catalog", local)
+    assert local.snapshot().items == []
+    assert other_worker.snapshot().items == []
+
+    import_catalog(db, [{"name": "Aluminum Can", "category": "Metal", "price_per_kg": 3.5}])
+
+    assert [item.name for item in local.snapshot().items] == ["Aluminum Can"]
+    assert other_worker.snapshot().version == local.snapshot().version == 1
+    assert [item.name for item in other_worker.snapshot().items] == ["Aluminum Can"]
+
+def test_async_reads_check_the_version_off_the_event_loop(session_factory, monkeypatch):
+    cache = CatalogCache(session_factory, check_interval=3600)
+    threads = []
+    load = cache.snapshot
+    def snapshot():
+        threads.append(threading.current_thread())
+        return load()
+    monkeypatch.setattr(cache, "snapshot", snapshot)
+
+    async def read_twice():
+        return await cache.snapshot_async(), await cache.snapshot_async()
+    first, second = asyncio.run(read_twice())
+
+    # Only the first read queried the database, and it did so on a worker thread
+    assert first is second
+    assert len(threads) == 1 and threads[0] is not threading.main_thread()
+    assert (cache.hits, cache.misses) == (1, 1)
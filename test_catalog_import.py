@@ -0,0 +1,61 @@
+import pytest
+from fastapi.testclient import TestClient
+from app import models
+from app.catalog_import import CatalogImportError, import_catalog, parse_catalog
+from app.database import get_async_db
+from app.main import app
+from app.routers.admin import get_current_admin
+
+
+def test_import_validates_everything_then_applies_in_bulk(db, count_statements):
+    seed = [{"name": f"Item {i}", "category": "Metal", "price_per_kg": 1.0} for i in range(10)]
+    with count_statements() as statements:
+        assert import_catalog(db, seed) == {"created": 10, "updated": 0, "unchanged": 0}
+    # New items go in as one executemany INSERT
+    assert sum(statement.startswith("INSERT INTO recyclable_items") for statement in statements) == 1
+
+    prices = parse_catalog(
+        "name,price_per_kg\n" + "".join(f"Item {i},2.5\n" for i in range(5)) + "Item 9,1.0\n", "csv"
+    )
+    with count_statements() as statements:
+        assert import_catalog(db, prices) == {"created": 0, "updated": 5, "unchanged": 1}
+    assert sum(statement.startswith("UPDATE recyclable_items") for statement in statements) == 1
+
+    bad = parse_catalog('[{"name": "Item 0", "price_per_kg": 9}, {"name": "New"}, {"name": "Item 1", "price_per_kg": -1}]', "json")
+    with pytest.raises(CatalogImportError) as exc_info:
+        import_catalog(db, bad)
+    assert [error["row"] for error in exc_info.value.errors] == [2, 3]
+    db.rollback()
+    prices = {item.name: item.price_per_kg for item in db.query(models.RecyclableItem)}
+    assert prices["Item 0"] == 2.5
+    assert prices["Item 9"] == 1.0
+    assert "New" not in prices
+
+@pytest.fixture
+def admin_client(async_session_factory):
+    async def test_db():
+        async with async_session_factory() as db:
+            yield db
+    app.dependency_overrides[get_async_db] = test_db
+    app.dependency_overrides[get_current_admin] = lambda: None
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+def test_unreadable_uploads_are_rejected_with_422(admin_client, db):
+    response = admin_client.post("/admin/items/import", files={"file": ("items.csv", b"\xffname,category\n")})
+    assert response.status_code == 422
+    assert "not valid UTF-8" in response.json()["detail"][0]["detail"]
+
+    # A file part without a filename, so the format cannot come from its extension
+    nameless = (
+        b'--b\r\nContent-Disposition: form-data; name="file"; filename=""\r\n\r\n'
+        b'name,category\nCan,Metal\n\r\n--b--\r\n'
+    )
+    headers = {"Content-Type": "multipart/form-data; boundary=b"}
+    response = admin_client.post("/admin/items/import", content=nameless, headers=headers)
+    assert response.status_code == 422
+    assert "format" in response.json()["detail"]
+    assert db.query(models.RecyclableItem).count() == 0
+
+    response = admin_client.post("/admin/items/import?format=csv", content=nameless, headers=headers)
+    assert response.json() == {"created": 1, "updated": 0, "unchanged": 0}
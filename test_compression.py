@@ -0,0 +1,106 @@
+import gzip
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from app.compression import CompressionMiddleware, PrecompressedStaticFiles, accepted_encodings, compress_static
+from app.responses import cache_headers, json_bytes, not_modified
+
+IMAGE = "images/05c33b6c-fa2e-4bc8-a485-8e9858fece97.png"
+
+
+def test_accept_encoding_negotiation():
+    assert accepted_encodings("gzip, deflate, br;q=0") == {"gzip", "deflate"}
+    assert accepted_encodings("br;q=0.5, gzip;q=bad") == {"br"}
+    assert accepted_encodings("") == set()
+
+def test_large_responses_are_compressed_with_a_weak_etag():
+    api = FastAPI()
+    api.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @api.get("/big")
+    def big():
+        return Response(b"[" + b",".join([b'{"name":"Aluminum Can"}'] * 100) + b"]", headers={"ETag": '"v1"'})
+
+    @api.get("/small")
+    def small():
+        return {"ok": True}
+
+    client = TestClient(api)
+    response = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == 'W/"v1"'
+    assert int(response.headers["content-length"]) < 500
+    assert response.json()[0] == {"name": "Aluminum Can"}
+
+    response = client.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert (response.headers["etag"], response.headers["vary"]) == ('"v1"', "Accept-Encoding")
+
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+def test_not_modified_responses_vary_on_accept_encoding():
+    api = FastAPI()
+    api.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @api.get("/items")
+    def items(request: Request, response: Response):
+        cache_headers(response, '"v1"', "public, max-age=60")
+        return not_modified(request, response) or json_bytes(b"[" + b",".join([b'{"name":"Can"}'] * 100) + b"]", response)
+
+    client = TestClient(api)
+    full = client.get("/items", headers={"Accept-Encoding": "gzip"})
+    cached = client.get("/items", headers={"Accept-Encoding": "gzip", "If-None-Match": full.headers["etag"]})
+    assert cached.status_code == 304
+    assert cached.headers["vary"] == full.headers["vary"] == "Accept-Encoding"
+
+def test_streamed_responses_are_compressed_and_images_are_not():
+    api = FastAPI()
+    api.add_middleware(CompressionMiddleware, minimum_size=500)
+    rows = [b"Aluminum Can,Metal,3.5\n" * 20] * 10
+
+    @api.get("/export")
+    def export():
+        return StreamingResponse(iter(rows), media_type="text/csv")
+
+    @api.get("/image")
+    def image():
+        return Response(b"\x89PNG" * 500, media_type="image/png")
+
+    client = TestClient(api)
+    response = client.get("/export", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.content == b"".join(rows)
+
+    response = client.get("/image", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.content == b"\x89PNG" * 500
+
+def test_static_files_serve_precompressed_variants(tmp_path):
+    page = b"<html>" + b"<p>Rinse and flatten.</p>" * 200 + b"</html>"
+    (tmp_path / "index.html").write_bytes(page)
+    (tmp_path / "images").mkdir()
+    (tmp_path / IMAGE).write_bytes(b"\x89PNG not really")
+    assert compress_static([str(tmp_path)]) == [str(tmp_path / "index.html.gz")]
+
+    api = FastAPI()
+    api.mount("/static", PrecompressedStaticFiles(directory=str(tmp_path)))
+    client = TestClient(api)
+
+    response = client.get("/static/index.html", headers={"Accept-Encoding": "gzip, br;q=0"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("text/html")
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) == len(gzip.compress(page, compresslevel=9, mtime=0))
+    assert response.content == page
+    cached = client.get("/static/index.html", headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+
+    response = client.get("/static/index.html", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.content == page
+
+    response = client.get(f"/static/{IMAGE}")
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert "cache-control" not in client.get("/static/index.html").headers
@@ -0,0 +1,45 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from app import models
+from app.exports import collections_export, transactions_export, stream_rows
+
+
+def test_exports_stream_in_chunks_with_filters(session_factory, db):
+    collectors = [
+        models.Collector(username=name, full_name=name, phone_number="12345678", hashed_password="x")
+        for name in ("ali", "sami")
+    ]
+    item = models.RecyclableItem(name="Aluminum Can", category="Metal", price_per_kg=1.0)
+    db.add_all(collectors + [item])
+    db.flush()
+    start = datetime(2026, 1, 1)
+    db.add_all([
+        models.Collection(
+            collector_id=collectors[i % 2].id, item_id=item.id, weight_kg=1.0, earned_amount=1.0,
+            collected_at=start + timedelta(hours=i)
+        )
+        for i in range(60)
+    ])
+    db.add_all([
+        models.Transaction(collector_id=collectors[0].id, transaction_type="collection", amount=float(i))
+        for i in range(5)
+    ])
+    db.commit()
+
+    chunks = list(stream_rows(collections_export(), "csv", session_factory, chunk_size=7))
+    rows = list(csv.DictReader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    assert len(chunks) == 9
+    assert len(rows) == 60
+    assert rows[0]["item_name"] == "Aluminum Can"
+
+    stmt = collections_export(start + timedelta(hours=10), start + timedelta(hours=20), collectors[1].id)
+    lines = b"".join(stream_rows(stmt, "ndjson", session_factory)).decode("utf-8").splitlines()
+    exported = [json.loads(line) for line in lines]
+    assert [row["collected_at"] for row in exported] == [
+        (start + timedelta(hours=hour)).isoformat() for hour in range(11, 20, 2)
+    ]
+
+    lines = b"".join(stream_rows(transactions_export(), "ndjson", session_factory)).decode("utf-8").splitlines()
+    assert [json.loads(line)["amount"] for line in lines] == [0.0, 1.0, 2.0, 3.0, 4.0]
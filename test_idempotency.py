@@ -0,0 +1,110 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from fastapi import HTTPException
+from app import models, schemas
+from app.idempotency import IdempotencyStore
+
+
+@pytest.fixture
+def collector_id(collector):
+    return collector.id
+
+def test_concurrent_duplicates_run_once(async_session_factory, db, collector_id):
+    store = IdempotencyStore(async_session_factory, wait_seconds=10)
+    request = schemas.TransactionCreate(amount=5)
+    executions = []
+
+    def execute(session):
+        executions.append(1)
+        time.sleep(0.2)
+        transaction = models.Transaction(
+            collector_id=collector_id, transaction_type="withdrawal", amount=-5
+        )
+        session.add(transaction)
+        return transaction
+
+    async def submit_async():
+        async with async_session_factory() as session:
+            result = await store.run(
+                session, collector_id, "retry-1", "POST /collectors/withdraw", request,
+                execute, schemas.TransactionResponse
+            )
+            return result.id if isinstance(result, models.Transaction) else json.loads(result.body)["id"]
+
+    # Each duplicate runs on its own thread and event loop, like separate workers
+    with ThreadPoolExecutor(4) as pool:
+        ids = list(pool.map(lambda _: asyncio.run(submit_async()), range(4)))
+
+    assert len(executions) == 1
+    assert len(set(ids)) == 1
+    assert db.query(models.Transaction).count() == 1
+    assert store.replays == 3
+
+def test_reused_key_with_other_body_is_rejected_and_failures_release_the_key(async_session_factory, db, collector_id):
+    store = IdempotencyStore(async_session_factory)
+
+    def fail(session):
+        raise HTTPException(status_code=400, detail="Insufficient balance")
+
+    def succeed(session):
+        transaction = models.Transaction(collector_id=collector_id, transaction_type="withdrawal", amount=-5)
+        session.add(transaction)
+        return transaction
+
+    async def withdraw(execute, amount):
+        async with async_session_factory() as session:
+            return await store.run(
+                session, collector_id, "k", "POST /collectors/withdraw",
+                schemas.TransactionCreate(amount=amount), execute, schemas.TransactionResponse
+            )
+
+    with pytest.raises(HTTPException):
+        asyncio.run(withdraw(fail, 5))
+    assert db.query(models.IdempotencyRecord).count() == 0
+
+    asyncio.run(withdraw(succeed, 5))
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(withdraw(succeed, 6))
+    assert exc_info.value.status_code == 422
+    assert db.query(models.Transaction).count() == 1
+
+def test_taken_over_claim_cannot_commit_its_write(async_session_factory, db, collector_id):
+    # With no lock time, a retry treats the first request's claim as abandoned at once
+    store = IdempotencyStore(async_session_factory, wait_seconds=1, lock_seconds=0)
+    request = schemas.TransactionCreate(amount=5)
+    entered, release = threading.Event(), threading.Event()
+
+    async def withdraw(wait=False):
+        def execute(session):
+            if wait:
+                entered.set()
+                release.wait()
+            transaction = models.Transaction(collector_id=collector_id, transaction_type="withdrawal", amount=-5)
+            session.add(transaction)
+            return transaction
+        async with async_session_factory() as session:
+            return await store.run(
+                session, collector_id, "slow", "POST /collectors/withdraw", request, execute, schemas.TransactionResponse
+            )
+
+    def slow_first():
+        try:
+            return asyncio.run(withdraw(wait=True))
+        except HTTPException as exc:
+            return exc
+
+    with ThreadPoolExecutor(1) as pool:
+        first = pool.submit(slow_first)
+        entered.wait()
+        taken_over = asyncio.run(withdraw())
+        release.set()
+        outcome = first.result()
+
+    assert isinstance(taken_over, models.Transaction)
+    assert isinstance(outcome, HTTPException) and outcome.status_code == 409
+    assert db.query(models.Transaction).count() == 1
+    assert db.query(models.IdempotencyRecord).one().status_code == 200
@@ -0,0 +1,102 @@
+import random
+import threading
+import pytest
+from sqlalchemy import func
+from app import aggregates, models, schemas
+from app.ledger import debit_balance, record_collections
+
+THREADS = 8
+OPERATIONS = 25
+
+
+def test_ledger_invariant_holds_under_concurrent_writers(session_factory, db, collector):
+    item = models.RecyclableItem(name="Aluminum Can", category="Metal", price_per_kg=1.0)
+    db.add(item)
+    db.commit()
+    collector_id, item_id = collector.id, item.id
+
+    credited, debited, errors = [], [], []
+    start = threading.Barrier(THREADS)
+
+    def writer(seed):
+        rng = random.Random(seed)
+        start.wait()
+        for _ in range(OPERATIONS):
+            session = session_factory()
+            try:
+                if rng.random() < 0.5:
+                    weight_kg = rng.choice([1.0, 2.0, 3.0])
+                    record_collections(session, collector_id, [
+                        schemas.CollectionCreate(item_id=item_id, weight_kg=weight_kg)
+                    ])
+                    session.commit()
+                    credited.append(weight_kg)
+                else:
+                    amount = rng.choice([1.0, 2.0, 5.0])
+                    if debit_balance(session, collector_id, amount):
+                        session.add(models.Transaction(
+                            collector_id=collector_id, transaction_type="withdrawal", amount=-amount
+                        ))
+                        session.commit()
+                        debited.append(amount)
+                    else:
+                        session.rollback()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                session.close()
+
+    threads = [threading.Thread(target=writer, args=(seed,)) for seed in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    db.expire_all()
+    stored = db.get(models.Collector, collector_id)
+    ledger_total = db.query(func.sum(models.Transaction.amount)).scalar() or 0.0
+    assert stored.balance == sum(credited) - sum(debited)
+    assert stored.balance == ledger_total
+    assert stored.balance >= 0
+    assert stored.total_collected_kg == sum(credited)
+    assert db.query(models.Collection).count() == len(credited)
+
+def test_reversed_concurrent_batches_do_not_deadlock(engine, session_factory, db, collector, monkeypatch):
+    if engine.dialect.name != "postgresql":
+        pytest.skip("SQLite serializes writers, so only PostgreSQL can deadlock on row locks")
+    # One shard, so both collectors write the same rollup rows
+    monkeypatch.setattr(aggregates, "ROLLUP_SHARDS", 1)
+    other = models.Collector(username="sami", full_name="Sami Ben Ali", phone_number="87654321", hashed_password="x")
+    items = [models.RecyclableItem(name=f"Item {i}", category=f"Category {i % 7}", price_per_kg=1.0) for i in range(200)]
+    db.add(other)
+    db.add_all(items)
+    db.commit()
+    entries = [schemas.CollectionCreate(item_id=item.id, weight_kg=1.0) for item in items]
+    start = threading.Barrier(2)
+    errors = []
+
+    def batch(collector_id, ordered):
+        session = session_factory()
+        try:
+            for _ in range(5):
+                start.wait()
+                record_collections(session, collector_id, ordered)
+                session.commit()
+        except Exception as exc:
+            errors.append(exc)
+            start.abort()
+        finally:
+            session.close()
+
+    threads = [
+        threading.Thread(target=batch, args=(collector.id, entries)),
+        threading.Thread(target=batch, args=(other.id, entries[::-1])),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [error for error in errors if not isinstance(error, threading.BrokenBarrierError)] == []
+    assert db.query(func.sum(models.DailyItemRollup.collection_count)).scalar() == 2 * 5 * len(items)
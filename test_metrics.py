@@ -0,0 +1,65 @@
+import threading
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from app.metrics import Counter, Histogram, MetricsMiddleware, pool_wait, render
+
+
+def test_shards_from_every_thread_are_summed():
+    counter = Counter("test_events_total", "Events.")
+    histogram = Histogram("test_latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    def record():
+        for _ in range(1000):
+            counter.inc()
+            histogram.observe(0.5, "/items")
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.render()[-1] == "test_events_total 4000.0"
+    assert histogram.render()[2:] == [
+        'test_latency_seconds_bucket{route="/items",le="0.1"} 0',
+        'test_latency_seconds_bucket{route="/items",le="1.0"} 4000',
+        'test_latency_seconds_bucket{route="/items",le="+Inf"} 4000',
+        'test_latency_seconds_sum{route="/items"} 2000.0',
+        'test_latency_seconds_count{route="/items"} 4000',
+    ]
+
+def test_requests_are_labelled_by_route_with_their_queries(engine):
+    session_factory = sessionmaker(bind=engine)
+    api = FastAPI()
+    api.add_middleware(MetricsMiddleware)
+
+    def get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    # The metrics are process-wide, so each backend run gets its own route
+    route = f"/metrics-{engine.dialect.name}/{{name}}"
+
+    @api.get(route)
+    def three_queries(name: str, db=Depends(get_db)):
+        for _ in range(3):
+            db.execute(text("SELECT 1"))
+        return {"name": name}
+
+    client = TestClient(api)
+    waits_before = sum(pool_wait.collect().get((), [0])[:-1])
+    for name in ("a", "b"):
+        assert client.get(route.format(name=name)).status_code == 200
+    assert client.get("/no-such-route").status_code == 404
+
+    metrics = render()
+    labels = f'method="GET",route="{route}"'
+    assert f'http_request_duration_seconds_count{{{labels},status="200"}} 2' in metrics
+    assert 'route="unmatched",status="404"' in metrics
+    assert f'http_request_db_queries_bucket{{{labels},le="2"}} 0' in metrics
+    assert f'http_request_db_queries_bucket{{{labels},le="5"}} 2' in metrics
+    assert f'http_request_db_queries_sum{{{labels}}} 6' in metrics
+    assert sum(pool_wait.collect()[()][:-1]) >= waits_before + 2
@@ -0,0 +1,109 @@
+import importlib
+import threading
+import pytest
+from app import models
+from app.aggregates import ROLLUP_SHARDS
+from app.migrate import run_migrations, discover_migrations
+from app.query_plans import full_scans
+
+index_pack = importlib.import_module("app.migrations.0001_hot_query_indexes")
+
+
+def require_sqlite(engine):
+    if engine.dialect.name != "sqlite":
+        pytest.skip("EXPLAIN QUERY PLAN checks only run on SQLite")
+
+def test_migrations_apply_once(engine):
+    versions = [version for version, _, _ in discover_migrations()]
+    assert run_migrations(engine) == versions
+    assert run_migrations(engine) == []
+
+def test_hot_queries_use_indexes(engine):
+    require_sqlite(engine)
+    run_migrations(engine)
+    with engine.connect() as connection:
+        assert full_scans(connection) == {}
+
+def test_missing_index_is_reported(engine):
+    require_sqlite(engine)
+    run_migrations(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_collections_item")
+    with engine.connect() as connection:
+        assert list(full_scans(connection)) == ["item has collections"]
+
+def test_index_pack_upgrades_existing_database(engine):
+    # Simulate a database created before the indexes existed
+    with engine.begin() as connection:
+        for statement in index_pack.INDEXES:
+            name = statement.split(" EXISTS ")[1].split(" ON ")[0]
+            connection.exec_driver_sql(f"DROP INDEX {name}")
+
+    run_migrations(engine)
+    with engine.connect() as connection:
+        for statement in index_pack.INDEXES:
+            table = statement.split(" ON ")[1].split(" ")[0]
+            name = statement.split(" EXISTS ")[1].split(" ON ")[0]
+            assert name in {index["name"] for index in engine.dialect.get_indexes(connection, table)}
+        if engine.dialect.name == "sqlite":
+            assert full_scans(connection) == {}
+
+def test_rollups_are_resharded_on_existing_database(engine, db, collector):
+    item = models.RecyclableItem(name="Aluminum Can", category="Metal", price_per_kg=2.0)
+    db.add(item)
+    db.flush()
+    db.add(models.Collection(
+        collector_id=collector.id, item_id=item.id, item_category="Metal", weight_kg=3.0, earned_amount=6.0
+    ))
+    db.commit()
+    # Simulate a database whose rollups predate the shard column
+    run_migrations(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DELETE FROM schema_migrations WHERE version = 4")
+        connection.exec_driver_sql("DROP TABLE daily_item_rollups")
+        connection.exec_driver_sql(
+            "CREATE TABLE daily_item_rollups (day DATE, item_id INTEGER, collection_count INTEGER,"
+            " total_weight_kg FLOAT, total_revenue FLOAT, PRIMARY KEY (day, item_id))"
+        )
+
+    assert run_migrations(engine) == [4]
+    assert db.query(
+        models.DailyItemRollup.item_id, models.DailyItemRollup.shard, models.DailyItemRollup.total_revenue
+    ).all() == [(item.id, collector.id % ROLLUP_SHARDS, 6.0)]
+
+def test_collection_categories_are_backfilled_on_existing_database(engine, db, collector):
+    run_migrations(engine)
+    item = models.RecyclableItem(name="Aluminum Can", category="Metal", price_per_kg=2.0)
+    db.add(item)
+    db.flush()
+    # Collections recorded before the column existed have no category
+    db.add(models.Collection(collector_id=collector.id, item_id=item.id, weight_kg=3.0, earned_amount=6.0))
+    db.commit()
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DELETE FROM schema_migrations WHERE version = 5")
+
+    assert run_migrations(engine) == [5]
+    assert db.query(models.Collection.item_category).scalar() == "Metal"
+    assert db.query(
+        models.CollectorCategoryStats.category, models.CollectorCategoryStats.total_earned
+    ).all() == [("Metal", 6.0)]
+
+def test_workers_starting_together_apply_each_migration_once(engine):
+    versions = [version for version, _, _ in discover_migrations()]
+    start = threading.Barrier(4)
+    applied, errors = [], []
+
+    def worker():
+        start.wait()
+        try:
+            applied.extend(run_migrations(engine))
+        except Exception as exc:
+            errors.append(exc)
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(applied) == versions
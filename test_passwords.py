@@ -0,0 +1,62 @@
+import threading
+import bcrypt
+import pytest
+from fastapi import HTTPException
+from app import main
+from app.metrics import render
+from app.passwords import PasswordHasher
+
+
+def test_hash_uses_configured_rounds_on_worker_processes():
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=4)
+    try:
+        hashed = hasher.hash("secret123")
+        assert bcrypt.checkpw(b"secret123", hashed.encode("utf-8"))
+        assert hashed.startswith("$2b$04$")
+        assert hasher.verify("secret123", hashed)
+        assert not hasher.verify("wrong", hashed)
+        assert not hasher.verify("secret123", "not-a-hash")
+    finally:
+        hasher.shutdown()
+    assert hasher.stats()["completed"] == 4
+
+def test_broken_pool_is_replaced():
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=4)
+    try:
+        hashed = hasher.hash("secret123")
+        for process in list(hasher._executor._processes.values()):
+            process.kill()
+            process.join()
+        assert hasher.verify("secret123", hashed)
+        assert hasher.verify("secret123", hasher.hash("secret123"))
+    finally:
+        hasher.shutdown()
+    assert hasher.stats()["restarts"] == 1
+
+def test_saturated_pool_returns_503():
+    hasher = PasswordHasher(rounds=4, workers=0, max_pending=1)
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_hash(*args):
+        entered.set()
+        release.wait()
+        return "done"
+
+    worker = threading.Thread(target=hasher._run, args=(slow_hash,))
+    worker.start()
+    entered.wait()
+    try:
+        with pytest.raises(HTTPException) as exc_info:
+            hasher.hash("secret123")
+    finally:
+        release.set()
+        worker.join()
+
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers["Retry-After"]
+    assert hasher.stats()["rejected"] == 1
+    assert hasher.stats()["in_flight"] == 0
+
+def test_cost_factor_is_exported_as_a_metric(monkeypatch):
+    monkeypatch.setattr(main, "password_hasher", PasswordHasher(rounds=5, workers=0))
+    assert "\npassword_hash_bcrypt_rounds 5\n" in render()
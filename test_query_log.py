@@ -0,0 +1,53 @@
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models
+from app.query_log import QueryLogBuffer
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def logged(session_factory) -> list:
+    with session_factory() as db:
+        return sorted(row.query_text for row in db.query(models.CitizenQuery))
+
+def test_full_batch_is_written_without_waiting_for_the_interval(session_factory):
+    buffer = QueryLogBuffer(session_factory, batch_size=3, flush_interval_ms=60000)
+    try:
+        for query in ("can", "box", "glass"):
+            assert buffer.record(query, 1)
+        wait_for(lambda: buffer.written == 3)
+        assert logged(session_factory) == ["box", "can", "glass"]
+    finally:
+        buffer.stop()
+
+def test_partial_batch_is_written_after_the_interval(session_factory):
+    buffer = QueryLogBuffer(session_factory, batch_size=100, flush_interval_ms=50)
+    try:
+        buffer.record("can", 1)
+        wait_for(lambda: buffer.written == 1)
+        assert buffer.pending == 0
+    finally:
+        buffer.stop()
+
+def test_stop_flushes_what_is_queued(session_factory):
+    buffer = QueryLogBuffer(session_factory, batch_size=100, flush_interval_ms=60000)
+    buffer.record("can", 1)
+    buffer.record("box", 0)
+    buffer.stop()
+    assert buffer.written == 2
+    assert logged(session_factory) == ["box", "can"]
+
+def test_rows_are_dropped_when_full_or_when_the_write_fails():
+    # No tables in this database, so every flush fails
+    broken = sessionmaker(bind=create_engine("sqlite://"))
+    buffer = QueryLogBuffer(broken, max_pending=2, batch_size=100, flush_interval_ms=60000)
+    assert buffer.record("can", 1)
+    assert buffer.record("box", 1)
+    assert not buffer.record("glass", 1)
+    buffer.stop()
+    assert (buffer.written, buffer.dropped, buffer.pending) == (0, 3, 0)
@@ -0,0 +1,83 @@
+import logging
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from app import database, models, schemas
+from app.database import RepeatedQueryError, normalize_statement
+from app.ledger import record_collections
+from app.metrics import MetricsMiddleware
+
+
+@pytest.fixture
+def client(engine):
+    """An app with one route that runs whatever the test hands it"""
+    session_factory = sessionmaker(bind=engine)
+    api = FastAPI()
+    api.add_middleware(MetricsMiddleware)
+    api.state.work = None
+
+    def get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @api.get("/work/{name}")
+    def work(name: str, db=Depends(get_db)):
+        api.state.work(db)
+        return {"name": name}
+
+    return TestClient(api)
+
+def test_statements_are_reduced_to_their_shape():
+    assert normalize_statement(
+        "SELECT *  FROM items\n WHERE id = :id_1 AND name = 'can' AND price > 2.5"
+    ) == "SELECT * FROM items WHERE id = ? AND name = ? AND price > ?"
+    assert normalize_statement("SELECT * FROM items WHERE id IN (%(id_1)s, %(id_2)s, %s)") == (
+        "SELECT * FROM items WHERE id IN (?)"
+    )
+
+def test_repeated_statements_in_one_request_are_flagged(client, monkeypatch, caplog):
+    def one_by_one(db):
+        for item_id in range(database.N_PLUS_ONE_THRESHOLD):
+            db.execute(text("SELECT :id"), {"id": item_id})
+    client.app.state.work = one_by_one
+
+    monkeypatch.setattr(database, "N_PLUS_ONE_MODE", "raise")
+    with pytest.raises(RepeatedQueryError, match="GET /work/{name}"):
+        client.get("/work/a")
+
+    monkeypatch.setattr(database, "N_PLUS_ONE_MODE", "log")
+    with caplog.at_level(logging.WARNING, logger="waste_app.sql"):
+        assert client.get("/work/a").status_code == 200
+    assert "Possible N+1 in GET /work/{name}: 10 executions of SELECT ?" in caplog.text
+
+def test_slow_queries_are_logged_with_route_and_parameters(client, monkeypatch, caplog):
+    client.app.state.work = lambda db: db.execute(text("SELECT :marker"), {"marker": "slow-one"})
+    monkeypatch.setattr(database, "SLOW_QUERY_MS", 0)
+    with caplog.at_level(logging.WARNING, logger="waste_app.sql"):
+        assert client.get("/work/a").status_code == 200
+    assert "in GET /work/{name}: SELECT" in caplog.text
+    assert "slow-one" in caplog.text
+
+def test_batch_across_many_items_is_not_flagged(client, db, collector, monkeypatch):
+    items = [
+        models.RecyclableItem(name=f"Item {i}", category=f"Category {i}", price_per_kg=1.0)
+        for i in range(database.N_PLUS_ONE_THRESHOLD + 5)
+    ]
+    db.add_all(items)
+    db.commit()
+    entries = [schemas.CollectionCreate(item_id=item.id, weight_kg=1.0) for item in items]
+
+    def record(session):
+        record_collections(session, collector.id, entries)
+        session.commit()
+    client.app.state.work = record
+
+    monkeypatch.setattr(database, "N_PLUS_ONE_MODE", "raise")
+    assert client.get("/work/a").status_code == 200
+    db.expire_all()
+    assert db.get(models.Collector, collector.id).balance == len(items)
@@ -0,0 +1,107 @@
+import threading
+import time
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event, update
+from sqlalchemy.orm.exc import StaleDataError
+from app import models, reconciliation
+from app.database import lock_exclusive
+from app.ledger import adjust_balance
+from app.reconciliation import RECONCILE_LOCK_KEY, reconcile_ledgers, drifted_ledgers
+
+
+def add_transactions(db, collector_id, amounts, age_seconds=120):
+    created_at = datetime.utcnow() - timedelta(seconds=age_seconds)
+    for amount in amounts:
+        adjust_balance(db, collector_id, amount)
+        db.add(models.Transaction(
+            collector_id=collector_id, transaction_type="collection", amount=amount, created_at=created_at
+        ))
+    db.commit()
+
+def test_reconciliation_only_reads_new_activity_and_reports_drift(db):
+    collectors = [
+        models.Collector(username=name, full_name=name, phone_number="12345678", hashed_password="x")
+        for name in ("ali", "sami")
+    ]
+    db.add_all(collectors)
+    db.commit()
+    ali, sami = (collector.id for collector in collectors)
+
+    add_transactions(db, ali, [5.0, 2.5])
+    add_transactions(db, sami, [1.0])
+    report = reconcile_ledgers(db)
+    assert (report["transactions_checked"], report["collectors_checked"], report["drifted"]) == (3, 2, [])
+
+    # Only the new transaction is read, and only its collector is re-checked
+    add_transactions(db, ali, [-4.0])
+    report = reconcile_ledgers(db)
+    assert (report["transactions_checked"], report["collectors_checked"]) == (1, 1)
+    assert reconcile_ledgers(db)["transactions_checked"] == 0
+
+    # A balance change without a transaction shows up on the next activity
+    db.execute(update(models.Collector).where(models.Collector.id == sami).values(balance=10.0))
+    db.commit()
+    add_transactions(db, sami, [2.0])
+    report = reconcile_ledgers(db)
+    assert [(row.collector_id, round(row.drift, 2)) for row in report["drifted"]] == [(sami, 9.0)]
+    assert [row.collector_id for row in drifted_ledgers(db)] == [sami]
+
+    report = reconcile_ledgers(db, full=True)
+    assert (report["transactions_checked"], report["collectors_checked"]) == (5, 2)
+    assert [row.collector_id for row in report["drifted"]] == [sami]
+
+def test_recent_transactions_wait_for_the_settle_window(db):
+    collector = models.Collector(username="ali", full_name="ali", phone_number="12345678", hashed_password="x")
+    db.add(collector)
+    db.commit()
+
+    add_transactions(db, collector.id, [3.0])
+    add_transactions(db, collector.id, [4.0], age_seconds=0)
+    add_transactions(db, collector.id, [5.0])
+    report = reconcile_ledgers(db, settle_seconds=60)
+    # The recent transaction and everything after it are left for later,
+    # but the balance check still accounts for them
+    assert (report["transactions_checked"], report["drifted"]) == (1, [])
+
+    report = reconcile_ledgers(db, settle_seconds=0)
+    assert (report["transactions_checked"], report["drifted"]) == (2, [])
+
+def test_runs_from_other_sessions_wait_for_the_lock(session_factory, db, collector):
+    add_transactions(db, collector.id, [3.0, 4.0])
+    holder = session_factory()
+    lock_exclusive(holder.connection(), RECONCILE_LOCK_KEY)
+    reports = []
+
+    def run():
+        with session_factory() as session:
+            reports.append(reconcile_ledgers(session))
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(0.3)
+    assert thread.is_alive()
+    holder.commit()
+    holder.close()
+    thread.join()
+
+    assert reports[0]["transactions_checked"] == 2
+    assert db.get(models.LedgerCheckpoint, collector.id).ledger_sum == 7.0
+
+def test_checkpoint_moved_underneath_a_run_is_not_folded_twice(session_factory, db, collector, monkeypatch):
+    add_transactions(db, collector.id, [3.0])
+    reconcile_ledgers(db)
+    add_transactions(db, collector.id, [4.0])
+    # A run that skipped the lock, moving the checkpoint while this one is about to write
+    monkeypatch.setattr(reconciliation, "lock_exclusive", lambda connection, key: None)
+    racer = session_factory()
+
+    @event.listens_for(db, "before_flush", once=True)
+    def race(session, flush_context, instances):
+        reconcile_ledgers(racer)
+    with pytest.raises(StaleDataError):
+        reconcile_ledgers(db)
+    db.rollback()
+    racer.close()
+
+    checkpoint = db.get(models.LedgerCheckpoint, collector.id)
+    assert checkpoint.ledger_sum == 7.0
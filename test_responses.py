@@ -0,0 +1,76 @@
+import json
+from typing import List
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+from app import models, schemas
+from app.catalog import CatalogCache, CatalogSnapshot, bump_version
+from app.main import app
+from app.routers import citizen
+from app.queries import list_collections, select_schema
+from app.responses import json_fragments, json_rows
+
+
+def validated(schema, rows):
+    """What FastAPI would send for these rows through the response_model"""
+    adapter = TypeAdapter(List[schema])
+    return json.loads(adapter.dump_json(adapter.validate_python(rows)))
+
+def test_fast_rows_match_the_response_model_output(db, collector):
+    item = models.RecyclableItem(name="Aluminum Can", category="Metal", instructions="Rinse", price_per_kg=3.5)
+    db.add(item)
+    db.flush()
+    db.add_all([
+        models.Collection(collector_id=collector.id, item_id=item.id, weight_kg=1.25, earned_amount=4.375)
+        for _ in range(3)
+    ] + [
+        models.Transaction(collector_id=collector.id, transaction_type="collection", amount=4.375)
+    ])
+    db.commit()
+
+    cases = [
+        (schemas.CollectionResponse, list_collections(db)),
+        (schemas.CollectorResponse, [row._asdict() for row in db.execute(select_schema(schemas.CollectorResponse, models.Collector))]),
+        (schemas.TransactionResponse, [row._asdict() for row in db.execute(select_schema(schemas.TransactionResponse, models.Transaction))]),
+    ]
+    for schema, rows in cases:
+        assert json.loads(json_rows(rows).body) == validated(schema, rows)
+
+    snapshot = CatalogSnapshot(1, [schemas.RecyclableItemResponse.model_validate(item)])
+    body = json_fragments(list(snapshot.encoded.values())).body
+    assert json.loads(body) == validated(schemas.RecyclableItemResponse, snapshot.items)
+
+def test_fast_routes_keep_their_openapi_schema():
+    paths = app.openapi()["paths"]
+    for path, schema in [
+        ("/collectors/collections", "CollectionResponse"),
+        ("/collectors/transactions", "TransactionResponse"),
+        ("/admin/collectors", "CollectorResponse"),
+        ("/citizen/items", "RecyclableItemResponse"),
+    ]:
+        content = paths[path]["get"]["responses"]["200"]["content"]["application/json"]
+        assert content["schema"]["items"]["$ref"] == f"#/components/schemas/{schema}"
+
+def test_catalog_routes_revalidate_with_etags(session_factory, db, monkeypatch):
+    monkeypatch.setattr(citizen, "catalog", CatalogCache(session_factory, check_interval=0))
+    item = models.RecyclableItem(name="Aluminum Can", category="Metal", price_per_kg=3.5)
+    db.add(item)
+    bump_version(db)
+    db.commit()
+    client = TestClient(app)
+
+    for path in ["/citizen/items", "/citizen/items?query=alu", f"/citizen/items/{item.id}", "/citizen/categories"]:
+        response = client.get(path)
+        etag = response.headers["etag"]
+        assert response.status_code == 200
+        assert response.headers["cache-control"].startswith("public, max-age=")
+
+        cached = client.get(path, headers={"If-None-Match": f'"stale", W/{etag}'})
+        assert (cached.status_code, cached.content, cached.headers["etag"]) == (304, b"", etag)
+
+    item.price_per_kg = 4.0
+    bump_version(db)
+    db.commit()
+    response = client.get("/citizen/items", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()[0]["price_per_kg"] == 4.0
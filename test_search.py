@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+from app.search import SearchIndex
+
+ITEMS = [
+    SimpleNamespace(id=1, name="Aluminum Can", category="Metal", instructions="Rinse and flatten."),
+    SimpleNamespace(id=2, name="Steel Can", category="Metal", instructions="Rinse well."),
+    SimpleNamespace(id=3, name="Cardboard Box", category="Paper", instructions="Flatten. Keep dry."),
+    SimpleNamespace(id=4, name="Newspaper", category="Paper", instructions=None),
+    SimpleNamespace(id=5, name="Rinse Bottle", category="Plastic", instructions=None),
+]
+
+index = SearchIndex(ITEMS)
+
+def test_prefix_match():
+    items, total = index.search("alum")
+    assert [item.id for item in items] == [1]
+    assert total == 1
+
+def test_all_terms_must_match():
+    items, total = index.search("steel can")
+    assert [item.id for item in items] == [2]
+    assert total == 1
+
+def test_name_match_ranks_above_instructions():
+    items, total = index.search("rinse")
+    assert [item.id for item in items] == [5, 1, 2]
+    assert total == 3
+
+def test_no_match():
+    assert index.search("glass") == ([], 0)
+    assert index.search("  ") == ([], 0)
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from app import models
+from app.auth import issue_tokens, rotate_refresh_token
+from app.revocation import RevocationList, to_timestamp
+
+
+def test_refresh_tokens_rotate_and_reuse_revokes_the_family(db, collector):
+    first = issue_tokens(db, collector)["refresh_token"]
+    db.commit()
+
+    assert rotate_refresh_token(db, first).id == collector.id
+    second = issue_tokens(db, collector)["refresh_token"]
+    db.commit()
+
+    with pytest.raises(HTTPException) as exc_info:
+        rotate_refresh_token(db, first)
+    assert exc_info.value.status_code == 401
+    with pytest.raises(HTTPException):
+        rotate_refresh_token(db, second)
+
+def test_revocations_reach_other_workers_on_sync(session_factory, db, collector):
+    writer = RevocationList(session_factory)
+    reader = RevocationList(session_factory)
+    reader.sync()
+    issued_at = to_timestamp(datetime.utcnow()) - 1
+    expires_at = datetime.utcnow() + timedelta(minutes=15)
+
+    writer.revoke_token(db, "logged-out", expires_at)
+    writer.revoke_collector(db, collector.id, expires_at)
+    db.commit()
+    assert writer.is_revoked("logged-out", 0, issued_at)
+    assert not reader.is_revoked("logged-out", 0, issued_at)
+
+    reader.sync()
+    assert reader.is_revoked("logged-out", 0, issued_at)
+    assert reader.is_revoked("other", collector.id, issued_at)
+    assert not reader.is_revoked("other", collector.id, issued_at + 60)
+    assert not reader.is_revoked("other", collector.id + 1, issued_at)
+
+def test_revocations_apply_locally_only_once_committed(session_factory, db, collector):
+    revocations = RevocationList(session_factory)
+    revocations.sync()
+    expires_at = datetime.utcnow() + timedelta(minutes=15)
+
+    revocations.revoke_token(db, "rolled-back", expires_at)
+    assert not revocations.is_revoked("rolled-back", 0, 0)
+    db.rollback()
+    revocations.revoke_collector(db, collector.id, expires_at)
+    db.commit()
+    assert not revocations.is_revoked("rolled-back", 0, 0)
+
+    # iat is whole seconds: a token issued in the same second as the ban is covered by it
+    banned_at = db.query(models.TokenRevocation).one().revoked_at
+    assert revocations.is_revoked("other", collector.id, int(to_timestamp(banned_at)))
+    assert revocations.is_revoked("other", collector.id, to_timestamp(banned_at.replace(microsecond=999999)))
+    assert not revocations.is_revoked("other", collector.id, int(to_timestamp(banned_at)) + 1)